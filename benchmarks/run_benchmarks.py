@@ -0,0 +1,272 @@
+"""
+Benchmark suite for the complexity methods and the preprocessing pipeline. To be run from the root of the repository, e.g.
+
+    python -m benchmarks.run_benchmarks --patients 1 2 --raw-hours 6 --save-baseline baseline.json
+    python -m benchmarks.run_benchmarks --patients 1 2 --raw-hours 6 --compare baseline.json
+
+Every benchmark reports its wall time (best of a number of repeats), peak memory (as traced by tracemalloc) and throughput.
+The correctness checks compare the optimized code paths with straightforward reference implementations.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import numpy as np
+from lib import activity_counts
+from lib import complexity
+from lib import helpers
+from lib import monitor
+from lib import windowing
+
+
+def measure(func, repeats=1):
+    """
+    Runs a function a number of times and measures its wall time and peak memory.
+
+    :param func: function without arguments to measure
+    :param repeats: number of times to run the function, the best wall time is reported
+
+    return: the result of the last run, the best wall time (in seconds) and the peak memory of the traced run (in bytes)
+    """
+
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start() # memory is traced in a separate run, since tracing slows down the function
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, best, peak
+
+
+def synthetic_raw(filename, hours, fs=50, seed=0, extra=123):
+    """
+    Writes a synthetic raw acceleration recording to a csv file, in the format expected by "activity_counts.read_csv". The signal consists
+    of gravity along the Z axis, sensor noise, and bursts of periodic movement every other half hour.
+
+    :param filename: path to the csv file to write
+    :param hours: length of the recording in hours
+    :param fs: sampling frequency in Hz, default value 50
+    :param seed: seed of the random number generator
+    :param extra: number of samples appended after the whole hours, so the recording does not end on a minute boundary and the last,
+                  partially filled minute is checked as well, default value 123
+
+    return: number of samples written
+    """
+
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 * fs) + extra
+    t = np.arange(n) / fs
+    active = (np.sin(2 * np.pi * t / 3600) > 0) * 0.3
+    sig = pd.DataFrame({"X": rng.normal(0, 0.05, n) + active * np.sin(2 * np.pi * 1.3 * t),
+                        "Y": rng.normal(0, 0.05, n) + 0.2,
+                        "Z": rng.normal(0, 0.05, n) + 0.97},
+                       index=pd.date_range("2021-03-16 20:00:00", periods=n, freq=pd.Timedelta(seconds=1/fs)))
+    sig.to_csv(filename, header=False, float_format="%.4f", date_format="%Y-%m-%d %H:%M:%S.%f")
+
+    return n
+
+
+def reference_moments(seq, scales, steps):
+    """
+    Reference implementation of "complexity.aggregation_moments", summing every segment separately as in the original algorithms.
+    """
+
+    means = []
+    variances = []
+    for n, step in zip(scales, steps):
+        rescaled = []
+        i = 0
+        while i < len(seq)-n+step:
+            rescaled.append(sum(seq[i:i+n]))
+            i += step
+        means.append(np.mean(rescaled))
+        variances.append(np.var(rescaled))
+
+    return np.array(means), np.array(variances)
+
+
+def run_benchmarks(patient_ids, raw_hours, width="3 days", step="5 min", n_min=1, n_max=9*60, repeats=3, reference=False):
+    """
+    Runs all benchmarks on the activity counts of the given patients and on a synthetic raw recording.
+
+    :param patient_ids: which patients' activity counts to benchmark the complexity methods on
+    :param raw_hours: length of the synthetic raw recording in hours, 0 skips the preprocessing benchmarks
+    :param width: width of the sliding window in "complexity_evolution" and "sliding_window_activity"
+    :param step: step size of the sliding window
+    :param n_min: minimal level of aggregation
+    :param n_max: maximal level of aggregation
+    :param repeats: number of repeats per benchmark
+    :param reference: a boolean indicating whether to also benchmark the window-by-window "complexity_evolution", which is slow
+
+    return: list of dictionaries, one per benchmark, with the keys "name", "time", "peak_memory", "throughput" and "unit"
+    """
+
+    results = []
+
+    def record(name, func, amount, unit):
+        _, best, peak = measure(func, repeats)
+        results.append({"name": name, "time": best, "peak_memory": peak, "throughput": amount / best, "unit": unit})
+
+    for patient_id in patient_ids:
+        df = helpers.read_counts(patient_id)
+        seq = np.array(df["counts"])
+        window = seq[:int(pd.Timedelta(width) / pd.Timedelta("1 min")) + 1]
+        n_windows = len(windowing.window_bounds(df.index, width, step)[0])
+
+        record("allometric_aggregation[{}]".format(patient_id), lambda: complexity.allometric_aggregation(window, n_max, draw=False), len(window), "samples/s")
+        record("adapted_allometric_aggregation[{}]".format(patient_id), lambda: complexity.adapted_allometric_aggregation(window, n_min, n_max, draw=False), len(window), "samples/s")
+        if (reference):
+            record("complexity_evolution[{}]".format(patient_id), lambda: complexity.complexity_evolution(df, width, step, n_min, n_max), n_windows, "windows/s")
+        record("complexity_evolution_incremental[{}]".format(patient_id), lambda: complexity.complexity_evolution(df, width, step, n_min, n_max, incremental=True), n_windows, "windows/s")
+        record("complexity_evolution_batched[{}]".format(patient_id), lambda: complexity.complexity_evolution(df, width, step, n_min, n_max, incremental=True, batched_fit=True), n_windows, "windows/s")
+        record("sliding_window_activity[{}]".format(patient_id), lambda: helpers.sliding_window_activity(df, width, step), n_windows, "windows/s")
+
+    if (raw_hours > 0):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "raw.csv")
+            n_samples = synthetic_raw(filename, raw_hours)
+            record("activity_counts_pipeline[{}h]".format(raw_hours), lambda: activity_counts.activity_counts_pipeline(filename), n_samples, "samples/s")
+            record("activity_counts_pipeline_streaming[{}h]".format(raw_hours), lambda: activity_counts.activity_counts_pipeline(filename, streaming=True, chunksize=180000), n_samples, "samples/s")
+            record("activity_counts_pipeline_lean[{}h]".format(raw_hours), lambda: activity_counts.activity_counts_pipeline(filename, lean=True), n_samples, "samples/s")
+            record("parallel_activity_counts[{}h]".format(raw_hours), lambda: activity_counts.parallel_activity_counts(filename, block="1h", n_jobs=2), n_samples, "samples/s")
+
+    return results
+
+
+def run_checks(patient_ids, raw_hours, n_min=1, n_max=9*60):
+    """
+    Checks whether the optimized code paths give the same results as the reference implementations.
+
+    :param patient_ids: which patients' activity counts to check the complexity methods on
+    :param raw_hours: length of the synthetic raw recording in hours, 0 skips the preprocessing checks
+
+    return: list of dictionaries, one per check, with the keys "name", "max_abs_diff" and "passed"
+    """
+
+    checks = []
+
+    def check(name, expected, actual, tolerance):
+        diff = float(np.nanmax(np.abs(np.asarray(expected, dtype=float) - np.asarray(actual, dtype=float))))
+        checks.append({"name": name, "max_abs_diff": diff, "passed": diff <= tolerance})
+
+    for patient_id in patient_ids:
+        df = helpers.read_counts(patient_id)
+        seq = np.array(df["counts"])
+
+        scales, steps = complexity.aggregation_scales(n_min, n_max)
+        means, variances = complexity.aggregation_moments(seq[:4321], scales, steps)
+        ref_means, ref_variances = reference_moments(seq[:4321], scales, steps)
+        check("aggregation_moments_means[{}]".format(patient_id), np.log(ref_means), np.log(means), 1e-9)
+        check("aggregation_moments_variances[{}]".format(patient_id), np.log(ref_variances), np.log(variances), 1e-9)
+
+        sub = df.iloc[:4*24*60] # the window-by-window evolution is the reference, which is only run on 4 days to keep the checks fast
+        reference, timestamps, _ = complexity.complexity_evolution(sub, "3 days", "5 min", n_min, n_max)
+        for name, kwargs in [("incremental", {"incremental": True}), ("batched", {"incremental": True, "batched_fit": True}),
+                             ("parallel", {"incremental": True, "n_jobs": 2, "backend": "thread"})]:
+            dimensions, times, _ = complexity.complexity_evolution(sub, "3 days", "5 min", n_min, n_max, **kwargs)
+            check("complexity_evolution_{}[{}]".format(name, patient_id), reference, dimensions, 1e-9)
+            check("complexity_evolution_{}_timestamps[{}]".format(name, patient_id), pd.to_datetime(timestamps).asi8, pd.to_datetime(times).asi8, 0)
+
+        # the gap-aware windowing counts missing minutes as zero activity, which is checked by removing minutes and filling them with zeros
+        gapped = sub.drop(sub.index[2000:2600])
+        filled = gapped.reindex(sub.index, fill_value=0)
+        reference, _, _ = complexity.complexity_evolution(filled, "3 days", "5 min", n_min, n_max, incremental=True)
+        dimensions, _, _, coverage = complexity.complexity_evolution(gapped, "3 days", "5 min", n_min, n_max, incremental=True, min_coverage=0.0)
+        check("complexity_evolution_gaps[{}]".format(patient_id), reference, dimensions, 1e-9)
+
+        # replaying the counts through the online monitor gives the window ending at every sample, of which every 5th is a batch window
+        replayed = monitor.ComplexityMonitor("3 days", n_min, n_max).append(sub["counts"].to_numpy(dtype=float), emit="all")
+        reference, _, _ = complexity.complexity_evolution(sub, "3 days", "5 min", n_min, n_max, incremental=True, batched_fit=True)
+        check("complexity_monitor_replay[{}]".format(patient_id), reference, replayed[::5][:len(reference)], 1e-9)
+
+    if (raw_hours > 0):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "raw.csv")
+            synthetic_raw(filename, raw_hours)
+            reference = activity_counts.activity_counts_pipeline(filename)
+            streamed = activity_counts.activity_counts_pipeline(filename, streaming=True, chunksize=180000)
+            check("activity_counts_pipeline_streaming[{}h]".format(raw_hours), reference["counts"], streamed["counts"], 1e-3)
+            lean = activity_counts.activity_counts_pipeline(filename, lean=True)
+            check("activity_counts_pipeline_lean[{}h]".format(raw_hours), reference["counts"], lean["counts"], 1e-3)
+            parallel = activity_counts.parallel_activity_counts(filename, block="1h", n_jobs=2)
+            check("parallel_activity_counts[{}h]".format(raw_hours), reference["counts"], parallel["counts"], 1e-3)
+
+    return checks
+
+
+def compare(results, baseline, tolerance, noise=1e-3):
+    """
+    Compares the wall times of the benchmarks with a saved baseline.
+
+    :param results: list of benchmark results, as returned by "run_benchmarks"
+    :param baseline: list of benchmark results of the baseline
+    :param tolerance: relative slowdown which is still accepted, e.g. 0.2 flags every benchmark which is more than 20% slower
+    :param noise: absolute slowdown (in seconds) below which timing noise is assumed, default value 1 ms
+
+    return: list of dictionaries with the keys "name", "time", "baseline" and "ratio", for the benchmarks which regressed
+    """
+
+    baseline = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        if (result["name"] in baseline):
+            ratio = result["time"] / baseline[result["name"]]["time"]
+            if (ratio > 1 + tolerance and result["time"] - baseline[result["name"]]["time"] > noise):
+                regressions.append({"name": result["name"], "time": result["time"], "baseline": baseline[result["name"]]["time"], "ratio": ratio})
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the complexity methods and the preprocessing pipeline.")
+    parser.add_argument("--patients", nargs="+", type=int, default=[1], help="patient identifiers whose counts are used, default patient 1")
+    parser.add_argument("--raw-hours", type=float, default=3, help="length of the synthetic 50 Hz raw recording in hours, 0 to skip")
+    parser.add_argument("--repeats", type=int, default=3, help="number of repeats per benchmark")
+    parser.add_argument("--reference", action="store_true", help="also benchmark the (slow) window-by-window complexity_evolution")
+    parser.add_argument("--skip-checks", action="store_true", help="do not run the correctness checks")
+    parser.add_argument("--save-baseline", help="path of a JSON file to save the results to, to compare later runs with")
+    parser.add_argument("--compare", help="path of a JSON file with baseline results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown compared to the baseline which is flagged as regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.patients, args.raw_hours, repeats=args.repeats, reference=args.reference)
+    print("{:<50} {:>10} {:>12} {:>16}".format("benchmark", "time (s)", "memory (MB)", "throughput"))
+    for result in results:
+        print("{:<50} {:>10.4f} {:>12.1f} {:>12.0f} {}".format(result["name"], result["time"], result["peak_memory"] / 2**20, result["throughput"], result["unit"]))
+
+    failed = False
+    if (not args.skip_checks):
+        print()
+        for check in run_checks(args.patients, args.raw_hours):
+            print("{:<50} {:>10} (max abs diff {:.2e})".format(check["name"], "ok" if check["passed"] else "FAILED", check["max_abs_diff"]))
+            failed = failed or not check["passed"]
+
+    if (args.save_baseline):
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if (args.compare):
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print()
+        for regression in regressions:
+            print("REGRESSION {:<39} {:.4f} s vs {:.4f} s baseline ({:.2f}x)".format(regression["name"], regression["time"], regression["baseline"], regression["ratio"]))
+        if (len(regressions) == 0):
+            print("no regressions compared to the baseline")
+        failed = failed or len(regressions) > 0
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
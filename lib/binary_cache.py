@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+import pandas as pd
+import numpy as np
+
+def cache_path(filename):
+    """
+    Returns the path of the directory in which the binary cache of a CSV file is stored, next to the CSV file itself.
+
+    :param filename: path to the csv file
+
+    return: path to the cache directory
+    """
+    return filename + ".cache"
+
+
+def _signature(filename):
+    """
+    Describes the current state of a source file by its size and modification time, so a cache can be invalidated when its source changes.
+    """
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_cached(filename):
+    """
+    Checks whether a valid binary cache exists for a CSV file. A cache which was written for an older version of the file is removed.
+
+    :param filename: path to the csv file
+
+    return: a boolean indicating whether the cache can be read with "read_cache"
+    """
+
+    meta_file = os.path.join(cache_path(filename), "meta.json")
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+    except FileNotFoundError: # no cache, or a cache which is being removed by another process
+        return False
+    if (meta["source"] != _signature(filename)): # the source file changed after the cache was written
+        shutil.rmtree(cache_path(filename), ignore_errors=True) # another process may be removing the same cache
+        return False
+
+    return True
+
+
+def write_cache(filename, chunks, dtype=np.float32):
+    """
+    Converts the contents of a CSV file into a compact binary format. Every column is stored as a flat binary file of the given dtype,
+    which can be memory-mapped. When the timestamps are equidistant, only the first timestamp (as an int64 epoch in nanoseconds) and
+    the sampling period are stored instead of one timestamp per row. Otherwise, the timestamps are stored as an extra int64 column.
+    The chunks are written one by one, so the full file never needs to be in memory.
+
+    :param filename: path to the csv file that was read, the cache is stored next to it (see "cache_path")
+    :param chunks: iterable of dataframes with the consecutive rows of the csv file, indexed by the timestamps
+    :param dtype: the dtype in which to store the columns, default value float32
+    """
+
+    directory = cache_path(filename)
+    if (os.path.exists(directory)):
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    signature = _signature(filename)
+    files = {}
+    meta = {"source": signature, "dtype": np.dtype(dtype).str, "length": 0, "index": None, "columns": None, "start": None, "period": None, "regular": True}
+    previous = None # last timestamp of the previous chunk, to check the sampling period across chunk boundaries
+
+    try:
+        for chunk in chunks:
+            times = chunk.index.asi8
+            if (meta["columns"] is None):
+                meta["columns"] = list(chunk.columns)
+                meta["index"] = chunk.index.name
+                files = {col: open(os.path.join(directory, col + ".bin"), "wb") for col in meta["columns"] + ["_time"]}
+                if (len(times) > 0):
+                    meta["start"] = int(times[0])
+                if (len(times) > 1):
+                    meta["period"] = int(times[1] - times[0])
+
+            if (len(times) > 0):
+                diffs = np.diff(times) if previous is None else np.diff(np.concatenate(([previous], times)))
+                meta["regular"] = meta["regular"] and bool(np.all(diffs == meta["period"]))
+                previous = times[-1]
+
+            for col in meta["columns"]:
+                files[col].write(np.ascontiguousarray(chunk[col].to_numpy(dtype=dtype)).tobytes())
+            files["_time"].write(np.ascontiguousarray(times, dtype=np.int64).tobytes())
+            meta["length"] += len(chunk)
+
+    finally:
+        for f in files.values():
+            f.close()
+
+    if (meta["regular"] and "_time" in files):
+        os.remove(os.path.join(directory, "_time.bin")) # the timestamps are fully described by the start and the sampling period
+
+    if (_signature(filename) != signature): # the source changed while it was being converted
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+
+    # the meta data is written last, it marks the cache as complete. it is written to a temporary file first, so a concurrent reader 
+    # never parses a partially written file
+    tmp = os.path.join(directory, "meta.json.tmp" + str(os.getpid()))
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+
+
+def _meta(filename):
+    """
+    Reads the meta data of the binary cache of a CSV file.
+    """
+    with open(os.path.join(cache_path(filename), "meta.json")) as f:
+        return json.load(f)
+
+
+def read_timestamps(filename, start=0, stop=None):
+    """
+    Reads the timestamps of the rows start, ..., stop-1 of the binary cache of a CSV file. Only the timestamps of these rows are constructed
+    (from the first timestamp and the sampling period) or read (from the memory-mapped timestamps of an irregular sequence).
+
+    :param filename: path to the csv file for which a valid cache exists (see "is_cached")
+    :param start: first row, default value 0
+    :param stop: last+1 row, default value None reads up to the last row
+
+    return: numpy array containing the int64 epoch timestamps in nanoseconds
+    """
+
+    meta = _meta(filename)
+    stop = meta["length"] if stop is None else min(stop, meta["length"])
+    start = min(start, stop)
+
+    if (meta["regular"]):
+        period = meta["period"] if meta["period"] is not None else 0
+        first = meta["start"] if meta["start"] is not None else 0
+        return first + period * np.arange(start, stop, dtype=np.int64)
+
+    times = np.memmap(os.path.join(cache_path(filename), "_time.bin"), dtype=np.int64, mode="r", shape=(meta["length"],)) if meta["length"] > 0 \
+            else np.zeros(0, dtype=np.int64)
+    return np.array(times[start:stop])
+
+
+def read_arrays(filename, timestamps=True):
+    """
+    Reads the binary cache of a CSV file as plain numpy arrays, without building a dataframe. The columns are memory-mapped 
+    (copy-on-write, so the cached files are never modified), so only the rows which are accessed are read from disk.
+
+    :param filename: path to the csv file for which a valid cache exists (see "is_cached")
+    :param timestamps: a boolean indicating whether to also construct the timestamps of all rows (see "read_timestamps"), default value True
+
+    return: dictionary mapping every cached column to its (memory-mapped) numpy array, the int64 epoch timestamps in nanoseconds (None if 
+            timestamps is not set), and the name of the index
+    """
+
+    meta = _meta(filename)
+    directory = cache_path(filename)
+    length = meta["length"]
+    columns = {col: np.memmap(os.path.join(directory, col + ".bin"), dtype=np.dtype(meta["dtype"]), mode="c", shape=(length,)) if length > 0
+               else np.zeros(0, dtype=np.dtype(meta["dtype"])) for col in meta["columns"]}
+    times = read_timestamps(filename) if timestamps else None
+
+    return columns, times, meta["index"]
+
+
+def read_cache(filename):
+    """
+    Reads the binary cache of a CSV file back into a dataframe. Note that the dataframe holds a copy of the cached columns in memory, 
+    use "read_arrays" to memory-map them instead.
+
+    :param filename: path to the csv file for which a valid cache exists (see "is_cached")
+
+    return: the dataframe with the cached columns, indexed by the timestamps
+    """
+
+    columns, times, name = read_arrays(filename)
+    index = pd.DatetimeIndex(times.astype("datetime64[ns]"), name=name)
+
+    return pd.DataFrame(columns, index=index)
+
+
+def clear_cache(filename):
+    """
+    Removes the binary cache of a CSV file, if it exists.
+
+    :param filename: path to the csv file
+    """
+
+    shutil.rmtree(cache_path(filename), ignore_errors=True) # the cache may not exist, or be removed by another process at the same time
@@ -0,0 +1,108 @@
+import argparse
+import sys
+import time
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from lib import complexity
+from lib import helpers
+from lib import result_store
+
+def patient_complexity_evolution(patient_id, width, step, n_min, n_max, store=False):
+    """
+    Reads in the activity counts of one patient and extracts the evolution of the fractal dimension over time. The incremental
+    aggregation and the batched polynomial fit are used, since these give the same result as the window-by-window calculation.
+
+    :param patient_id: which patient's activity counts are read from memory
+    :param width: width of the sliding window, described as a string from which a Timedelta can be extracted (e.g. "3 days")
+    :param step: the step size with which to advance the window, described as a string from which a Timedelta can be extracted (e.g. "5 min")
+    :param n_min: minimal level of aggregation
+    :param n_max: maximal level of aggregation
+    :param store: a boolean indicating whether to load the results from the on-disk result store when they were stored before, and store
+                  them otherwise (see "result_store.cached_complexity_evolution"), default value False
+
+    return: the tidy dataframe with columns "patient", "width", "step", "n_min", "n_max", "timestamp", "scale" and "D", containing one row for
+            every combination of timestamp and scale
+    """
+
+    df = helpers.read_counts(patient_id)
+    if (store):
+        dimensions, timestamps, scales = result_store.cached_complexity_evolution(df, width, step, n_min, n_max)
+    else:
+        dimensions, timestamps, scales = complexity.complexity_evolution(df, width, step, n_min, n_max, incremental=True, batched_fit=True)
+
+    return pd.DataFrame({
+        "patient": patient_id,
+        "width": width,
+        "step": step,
+        "n_min": n_min,
+        "n_max": n_max,
+        "timestamp": np.repeat(pd.to_datetime(timestamps), len(scales)),
+        "scale": np.tile(scales, len(timestamps)),
+        "D": dimensions.ravel(),
+    })
+
+
+def cohort_complexity_evolution(patient_ids, param_sets, n_jobs=None, progress=True, store=False):
+    """
+    Extracts the evolution of the fractal dimension over time for every patient in a cohort and for every set of parameters.
+    Each combination of patient and parameter set is processed in a separate process of a process pool, the results are gathered into
+    one tidy dataframe.
+
+    :param patient_ids: list of patient identifiers, whose activity counts are read with "helpers.read_counts"
+    :param param_sets: list of dictionaries, each containing the keys "width", "step", "n_min" and "n_max" (see "complexity_evolution")
+    :param n_jobs: number of worker processes, default value None uses one process per core
+    :param progress: a boolean indicating whether to report the progress on stderr, or a function which is called with the number of
+                     finished tasks, the total number of tasks, the patient identifier and the parameter set of every finished task,
+                     default value True
+    :param store: a boolean indicating whether to use the on-disk result store (see "patient_complexity_evolution"), default value False
+
+    return: the tidy dataframe with columns "patient", "width", "step", "n_min", "n_max", "timestamp", "scale" and "D", sorted in the order
+            of "patient_ids" and "param_sets"
+    """
+
+    tasks = [(patient_id, params) for patient_id in patient_ids for params in param_sets]
+    results = [None] * len(tasks)
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {pool.submit(patient_complexity_evolution, patient_id, params["width"], params["step"], params["n_min"], params["n_max"], store): i
+                   for i, (patient_id, params) in enumerate(tasks)}
+
+        for finished, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            results[i] = future.result()
+            patient_id, params = tasks[i]
+            if (callable(progress)):
+                progress(finished, len(tasks), patient_id, params)
+            elif (progress):
+                print("[{}/{}] patient {}, {} ({:.1f} s)".format(finished, len(tasks), patient_id, params, time.time() - start), file=sys.stderr)
+
+    return pd.concat(results, ignore_index=True)
+
+
+def main(argv=None):
+    """
+    Command line interface of "cohort_complexity_evolution", writes the tidy dataframe to a CSV file. To be run from the root of the repository,
+    e.g. python -m lib.cohort --patients 1 2 3 --widths "3 days" "7 days" --jobs 4 --output evolution.csv
+    """
+
+    parser = argparse.ArgumentParser(description="Extract the evolution of the fractal dimension for a cohort of patients.")
+    parser.add_argument("--patients", nargs="+", type=int, default=list(range(1, 8)), help="patient identifiers, default all 7 patients")
+    parser.add_argument("--widths", nargs="+", default=["3 days"], help="window widths, e.g. \"3 days\"")
+    parser.add_argument("--step", default="5 min", help="step size with which to advance the window")
+    parser.add_argument("--n-min", type=int, default=1, help="minimal level of aggregation")
+    parser.add_argument("--n-max", type=int, default=9*60, help="maximal level of aggregation")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes, default one per core")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    parser.add_argument("--store", action="store_true", help="load stored results and store new ones in the result store (results.cache)")
+    parser.add_argument("--output", required=True, help="path of the CSV file to write the results to")
+    args = parser.parse_args(argv)
+
+    param_sets = [{"width": width, "step": args.step, "n_min": args.n_min, "n_max": args.n_max} for width in args.widths]
+    results = cohort_complexity_evolution(args.patients, param_sets, n_jobs=args.jobs, progress=not args.quiet, store=args.store)
+    results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,356 @@
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import scipy.stats as stats
 import numpy.polynomial.polynomial as poly
+from math import comb
+from functools import lru_cache
+from collections import OrderedDict
+import threading
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from lib import windowing
+from lib import instrumentation
 
-def allometric_aggregation(seq, n_max, draw=True):
+PLAN_CACHE_BYTES = 2**27 # maximal total size of the segment plans kept in memory (128 MiB), a plan of a window of 30k samples takes ~17 MB
+
+_plans = OrderedDict() # segment plans in order of last use, keyed by the length, scales and steps
+_plan_stats = {"hits": 0, "misses": 0, "bytes": 0}
+_plan_lock = threading.Lock() # the windows of "complexity_evolution" may be processed by a thread pool
+
+
+def _segment_plan(length, scales, steps):
+    """
+    Implementation of "segment_plan", with the scales and steps passed as tuples so they can be hashed.
+    """
+
+    scales = np.array(scales, dtype=int)
+    steps = np.array(steps, dtype=int)
+
+    # number of segments for every level, the segments start at i = k*step for all k with i < length-n+step
+    n_segments = np.maximum(0, -(-(length - scales + steps) // steps))
+
+    # gather the start index of every segment of every level in one array, labeled with the index of the level they belong to
+    labels = np.repeat(np.arange(len(scales)), n_segments)
+    offsets = np.arange(len(labels)) - np.repeat(np.cumsum(n_segments) - n_segments, n_segments)
+    starts = offsets * steps[labels]
+    ends = np.minimum(starts + scales[labels], length) # the last segment is cut off at the end of the sequence
+
+    plan = (n_segments, labels, starts, ends)
+    for array in plan:
+        array.setflags(write=False) # the plan is shared by all callers, so it should not be modified
+    return plan
+
+
+def segment_plan(length, scales, steps):
+    """
+    Determines the start and end index of every aggregated segment of every level of aggregation within a sequence of the given length
+    (see "aggregation_moments"). These indices are the same for every sequence of the same length, e.g. for every window in 
+    "complexity_evolution", so the plans are kept in an LRU cache which is bounded by the total size of the plans ("PLAN_CACHE_BYTES", 
+    see "plan_cache_info" and "clear_plan_cache"). A plan larger than the bound is calculated but not cached.
+
+    :param length: length of the sequence
+    :param scales: list of aggregation levels n (number of aggregated data points)
+    :param steps: list of step sizes with which the segments advance, one for every level in "scales"
+
+    return: read-only numpy arrays "n_segments" (number of segments per level), "labels" (index of the level of every segment), 
+            "starts" and "ends" (start and end index of every segment)
+    """
+
+    key = (int(length), tuple(int(n) for n in scales), tuple(int(step) for step in steps))
+    with _plan_lock:
+        plan = _plans.get(key)
+        if (plan is not None):
+            _plans.move_to_end(key)
+            _plan_stats["hits"] += 1
+            return plan
+        _plan_stats["misses"] += 1
+
+    plan = _segment_plan(*key)
+    size = sum(array.nbytes for array in plan)
+    if (size > PLAN_CACHE_BYTES):
+        return plan
+
+    with _plan_lock:
+        if (key not in _plans):
+            _plans[key] = plan
+            _plan_stats["bytes"] += size
+        while (_plan_stats["bytes"] > PLAN_CACHE_BYTES):
+            _, evicted = _plans.popitem(last=False)
+            _plan_stats["bytes"] -= sum(array.nbytes for array in evicted)
+
+    return plan
+
+
+def plan_cache_info():
+    """
+    Reports the usage of the caches of the scale schedules (see "aggregation_scales") and the segment plans (see "segment_plan").
+
+    return: dictionary with the entries "scales" and "segments", each containing the hits, misses, maximal size and current size of the cache.
+            the sizes of the segment plan cache are in bytes ("maxsize" and "currsize"), the number of cached plans is given by "plans"
+    """
+
+    with _plan_lock:
+        segments = {"hits": _plan_stats["hits"], "misses": _plan_stats["misses"], "maxsize": PLAN_CACHE_BYTES, 
+                    "currsize": _plan_stats["bytes"], "plans": len(_plans)}
+
+    return {"scales": _aggregation_scales.cache_info()._asdict(), "segments": segments}
+
+
+def clear_plan_cache():
+    """
+    Empties the caches of the scale schedules and the segment plans.
+    """
+
+    _aggregation_scales.cache_clear()
+    with _plan_lock:
+        _plans.clear()
+        _plan_stats.update(hits=0, misses=0, bytes=0)
+
+
+@instrumentation.instrumented()
+def aggregation_moments(seq, scales, steps):
+    """
+    Calculates the mean and variance of the aggregated segments for every level of aggregation n in "scales". For a level n with
+    corresponding step size, the segments start at indices 0, step, 2*step, ... as long as the start index is smaller than 
+    len(seq)-n+step. Every segment sums n consecutive samples, except for the last one which is cut off at the end of the sequence.
+    All segment sums of all levels are gathered from a single cumulative sum of the sequence, instead of summing each segment separately.
+    Many sequences of the same length can be processed at once by stacking them as the rows of a 2D array.
+
+    :param seq: numpy array of equidistant signal values, in our case 1-minute activity counts sequence, or 2D numpy array with one 
+                sequence per row
+    :param scales: list of aggregation levels n (number of aggregated data points)
+    :param steps: list of step sizes with which the segments advance, one for every level in "scales". a step equal to n results in 
+                  non-overlapping segments (original allometric aggregation), a smaller step results in overlapping segments
+
+    return: two numpy arrays containing the mean and variance of the aggregated segments, for every level n in "scales" (for 2D input, 
+            one row per sequence)
+    """
+
+    seq = np.asarray(seq, dtype=float)
+    cs = np.concatenate((np.zeros(seq.shape[:-1] + (1,)), np.cumsum(seq, axis=-1)), axis=-1) # cs[i] contains the sum of the first i samples
+
+    # the start and end index of every segment of every level only depend on the length of the sequence, so they are taken from the plan cache
+    n_segments, labels, starts, ends = segment_plan(seq.shape[-1], scales, steps)
+    rescaled = cs[..., ends] - cs[..., starts]
+
+    # the segments are ordered by level, so the segments of every level are summed as one contiguous group
+    means = np.full(seq.shape[:-1] + (len(n_segments),), np.nan) # levels without any segments get a nan mean and variance
+    variances = np.full(seq.shape[:-1] + (len(n_segments),), np.nan)
+    nonempty = n_segments > 0
+    if (np.any(nonempty)):
+        groups = (np.cumsum(n_segments) - n_segments)[nonempty]
+        means[..., nonempty] = np.add.reduceat(rescaled, groups, axis=-1) / n_segments[nonempty]
+        variances[..., nonempty] = np.add.reduceat((rescaled - means[..., labels]) ** 2, groups, axis=-1) / n_segments[nonempty]
+
+    return means, variances
+
+
+@instrumentation.instrumented()
+def sliding_aggregation_moments(seq, starts, stops, scales, steps):
+    """
+    Calculates the mean and variance of the aggregated segments for every level of aggregation n in "scales", for every window seq[start:stop]. 
+    This gives the same result as calling "aggregation_moments" on every window separately, but the windows are not processed one by one.
+    Instead, running sums and sums of squares of the segment sums are kept for every level: the sums of the full segments within a window 
+    are obtained as the difference of two running sums (subtracting the segments that left the window from the ones that entered it), 
+    and only the last segment of each window, which is cut off at the end of the window, is added separately. 
+    The segments of a window start at offsets 0, step, 2*step, ... from the start of the window, so they are accumulated with a stride 
+    equal to the step of their level. 
+
+    :param seq: numpy array of equidistant signal values, in our case 1-minute activity counts sequence
+    :param starts: numpy array containing the index in "seq" at which every window starts
+    :param stops: numpy array containing the index in "seq" at which every window stops (exclusive)
+    :param scales: list of aggregation levels n (number of aggregated data points)
+    :param steps: list of step sizes with which the segments advance, one for every level in "scales"
+
+    return: two 2D numpy arrays containing the mean and variance of the aggregated segments, for every window (rows) and every level n in "scales" (columns)
+    """
+
+    seq = np.asarray(seq, dtype=float)
+    starts = np.asarray(starts, dtype=int)
+    stops = np.asarray(stops, dtype=int)
+    cs = np.concatenate(([0.0], np.cumsum(seq))) # cs[i] contains the sum of the first i samples
+
+    means = np.full((len(starts), len(scales)), np.nan)
+    variances = np.full((len(starts), len(scales)), np.nan)
+
+    for k, (n, step) in enumerate(zip(scales, steps)):
+        running = _running_segment_sums(cs, n, step)
+        means[:, k], variances[:, k] = _window_segment_moments(cs, running, n, step, starts, stops)
+
+    return means, variances
+
+
+def _running_segment_sums(cs, n, step):
+    """
+    Calculates the running sums and sums of squares of the sums of all full segments of n samples, accumulated with a stride equal to step
+    (see "sliding_aggregation_moments"). These only depend on the sequence and the level of aggregation, so they can be shared by all
+    windows, whatever their width.
+
+    :param cs: cumulative sum of the sequence, preceded by a zero
+    :param n: level of aggregation
+    :param step: step size with which the segments of this level advance
+
+    return: the value with which the segment sums were centered, and the running sums and sums of squares of the centered segment sums
+    """
+
+    # sums of all full segments of n samples, for every possible start index in the sequence
+    full = cs[n:] - cs[:-n] if n < len(cs) else np.zeros(0)
+    shift = np.mean(full) if len(full) > 0 else 0.0 # segment sums are centered for a numerically stable variance
+    full = full - shift
+
+    # running sums with a stride equal to step, preceded by "step" zeros: running[j+step] is the sum of the segments 
+    # starting at j, j-step, j-2*step, ... 
+    padded = np.zeros(-(-len(full) // step) * step + step)
+    padded[step:step+len(full)] = full
+    running = np.cumsum(padded.reshape(-1, step), axis=0).ravel()
+    padded[step:step+len(full)] = full ** 2
+    running_sq = np.cumsum(padded.reshape(-1, step), axis=0).ravel()
+
+    return shift, running, running_sq
+
+
+def _window_segment_moments(cs, running, n, step, starts, stops):
+    """
+    Calculates the mean and variance of the aggregated segments of level n for every window, from the running sums returned by 
+    "_running_segment_sums" (see "sliding_aggregation_moments").
+
+    :param cs: cumulative sum of the sequence, preceded by a zero
+    :param running: the output of "_running_segment_sums" for this level
+    :param n: level of aggregation
+    :param step: step size with which the segments of this level advance
+    :param starts: numpy array containing the index at which every window starts
+    :param stops: numpy array containing the index at which every window stops (exclusive)
+
+    return: two numpy arrays containing the mean and variance of the aggregated segments of level n, for every window
+    """
+
+    shift, running, running_sq = running
+    lengths = stops - starts
+
+    # a window of length l contains n_full segments of n samples, and one more segment cut off at the end of the window 
+    # as long as its start is smaller than l-n+step (the same condition as in "aggregation_moments")
+    n_full = np.where(lengths >= n, (lengths - n) // step + 1, 0)
+    n_segments = np.maximum(0, -(-(lengths - n + step) // step))
+    first = np.minimum(starts, len(running) - 1) # only used as is when the window contains no full segments
+    last = np.where(n_full > 0, starts + n_full * step, first) # one step beyond the start index of the last full segment
+    sum_full = running[last] - running[first]
+    sum_sq_full = running_sq[last] - running_sq[first]
+
+    partial = np.where(n_segments > n_full, cs[stops] - cs[np.minimum(starts + n_full * step, len(cs) - 1)] - shift, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"): # windows without any segments get a nan mean and variance
+        mean = (sum_full + partial) / n_segments
+        variance = np.maximum(0.0, (sum_sq_full + partial ** 2) / n_segments - mean ** 2)
+
+    return shift + mean, variance
+
+
+@instrumentation.instrumented()
+def allometric_aggregation(seq, n_max, draw=False, return_artifacts=False):
     """
     The original allometric aggregation algorithm as defined by West. Returns the fractal dimension of a time series 
     and the log-log plot from which this was extracted.
 
     :param seq: numpy array of equidistant signal values, in our case 1-minute activity counts sequence
     :param n_max: maximal level of aggregation
-    :param draw: a boolean indicating whether or not to draw the log-log plot and the estimated slope, default value True
+    :param draw: a boolean indicating whether or not to draw the log-log plot and the estimated slope (see "plotting.plot_allometric_fit"), 
+                 default value False
+    :param return_artifacts: a boolean indicating whether to also return the means, variances and fitted line, from which the log-log plot 
+                             can be drawn later on, default value False
 
-    return: the fractal dimension of the sequence (float)
+    return: the fractal dimension of the sequence (float), and if return_artifacts is set, a dictionary containing the "means" and 
+            "variances" for every level of aggregation and the "slope" and "intercept" of the fitted line
     """
 
     # perform aggregation for n (number of aggregated data points) ranging from 1 to n_max
-    means = np.zeros(n_max)
-    variances = np.zeros(n_max)
-
-    for n in range(1, n_max + 1):
-
-        rescaled = []
-        i = 0
-        # all blocks except for maybe the last one will aggregate n datapoints,
-        # the last block aggregates the remainder of the data points, which is not always equal to n
-        # this can lead to end effects, which make the method unstable when applied to shorter sequences
-        while i < len(seq):
-            agg = sum(seq[i:i+n])
-            rescaled.append(agg)
-            i += n
-        # calculate mean and variance for all levels of aggregation
-        means[n-1] = np.mean(rescaled)
-        variances[n-1] = np.var(rescaled)
+    # all blocks except for maybe the last one will aggregate n datapoints,
+    # the last block aggregates the remainder of the data points, which is not always equal to n
+    # this can lead to end effects, which make the method unstable when applied to shorter sequences
+    scales = np.arange(1, n_max + 1)
+    means, variances = aggregation_moments(seq, scales, scales) # the step equals n, so the blocks do not overlap
 
     # calculate slope of relation between mean and variance
     b, a, r_value, p_value, std_err = stats.linregress(np.log(means), np.log(variances))
 
-    # draw fitted line
+    # draw fitted line (see "plotting")
     if (draw):
-        fig, ax = plt.subplots(1)
-        plt.scatter(means, variances)
-        plt.plot(means, np.exp(a) * means ** b, color='red')
-        ax.set_yscale("log")
-        ax.set_xscale("log")
-        plt.xlabel("mean")
-        plt.ylabel("variance")
+        from lib import plotting
+        plotting.plot_allometric_fit(means, variances, b, a)
 
     # calculate fractal dimension
     D = 2 - b / 2
 
+    if (return_artifacts):
+        return D, {"means": means, "variances": variances, "slope": b, "intercept": a}
+
     return D
 
 
-def adapted_allometric_aggregation(seq, n_min, n_max, s=1.1, draw=True):
+def batched_allometric_aggregation(seqs, n_max):
     """
-    The adapted allometric aggregation algorithm. Returns the fractal dimension of a time series for various scales 
-    and the log-log plot from which these were extracted. We draw attention to the changes that were made compared to the original
-    allometric aggregation algorithm in the comments. 
+    Batched version of "allometric_aggregation", which calculates the fractal dimension of many sequences of the same length at once.
+    The blocks of n samples of all sequences are summed in one vectorized pass (see "aggregation_moments"), with the same handling of
+    the last block (which aggregates the remainder of the data points) as the original algorithm, and the slopes of all sequences are
+    obtained by vectorized least squares regression.
 
-    :param seq: numpy array of equidistant signal values, in our case 1-minute activity counts sequence
-    :param n_min: minimal level of aggregation
+    :param seqs: 2D numpy array containing one sequence of equidistant signal values per row
     :param n_max: maximal level of aggregation
-    :param s: factor controlling the spread of the aggregation levels within the interval [n_min, n_max], default value 1.1
-    :param draw: a boolean indicating whether or not to draw the log-log plot and the estimated polynomial, default value True
 
-    return: the fractal dimension of the sequence (float) for every level n in scales
+    return: numpy array containing the fractal dimension of every sequence
+    """
+
+    scales = np.arange(1, n_max + 1)
+    means, variances = aggregation_moments(np.atleast_2d(seqs), scales, scales) # the step equals n, so the blocks do not overlap
+
+    # slope of the least squares regression line between log(mean) and log(variance), for every sequence
+    x = np.log(means)
+    y = np.log(variances)
+    x_centered = x - x.mean(axis=1, keepdims=True)
+    b = np.sum(x_centered * (y - y.mean(axis=1, keepdims=True)), axis=1) / np.sum(x_centered ** 2, axis=1)
+
+    # calculate fractal dimension
+    D = 2 - b / 2
+
+    return D
+
+
+def allometric_evolution(sig, width, step, n_max, batch_size=256):
+    """
+    Extracts the evolution of the fractal dimension over time with the original allometric aggregation algorithm, using the same sliding 
+    windows as "complexity_evolution", so the baseline method can be compared to the adapted method for every window.
+
+    :param sig: dataframe containing the activity counts and the timestamps these correspond to (the start of the 1-minute interval
+                for which these were obtained)
+    :param width: width of the window which slides over the sequence, described as a string from which a Timedelta can be extracted (e.g. "3 days")
+    :param step: the step size with which to advance the window, described as a string from which a Timedelta can be extracted (e.g. "5 min")
+    :param n_max: maximal level of aggregation
+    :param batch_size: number of windows which are processed at once, limiting the memory used by the batched aggregation, default value 256
+
+    return: numpy array "dimensions" containing the fractal dimension for every timestamp in "timestamps", and numpy array "timestamps" 
+            containing the end of the window for which each fractal dimension was obtained
+    """
+
+    starts, stops, window_ends = windowing.window_bounds(sig.index, width, step)
+    windows = windowing.window_views(sig["counts"].to_numpy(dtype=float), starts, stops)
+
+    if (isinstance(windows, np.ndarray)): # all windows have the same length, so they are processed in batches
+        dimensions = [batched_allometric_aggregation(windows[i:i+batch_size], n_max) for i in range(0, len(windows), batch_size)]
+        dimensions = np.concatenate(dimensions) if len(dimensions) > 0 else np.zeros(0)
+    else:
+        dimensions = np.array([allometric_aggregation(window, n_max, draw=False) for window in windows])
+
+    return dimensions, np.array(window_ends.to_pydatetime())
+
+
+@lru_cache(maxsize=128)
+def _aggregation_scales(n_min, n_max, s):
+    """
+    Cached implementation of "aggregation_scales", returning read-only arrays.
     """
 
-    means = []
-    variances = []
     scales = []
+    steps = []
     n = n_min # the first aggregation step aggregates n_min samples
     
     while n <= n_max:
@@ -80,48 +359,254 @@ def adapted_allometric_aggregation(seq, n_min, n_max, s=1.1, draw=True):
                                     # if step would be equal to n, we would allow no overlap like in the original AA algorithm
                                     # now, step is at least 16 times smaller than n, generating 16 times more segments 
                                     # (now partially overlapping) to estimate mean and var from
-        rescaled = []
-        i = 0
-        
-        while i < len(seq)-n+step: # every segment always contains n samples, except for the last one, which contains at least 15/16*n samples
-                                    # this ensures a reliable calculation of the mean and variance, avoiding end effects
-            agg = sum(seq[i:i+n])
-            rescaled.append(agg)
-            i += step # sliding window moves forward with steps smaller than n, allowing the segments to overlap
-        
-        means.append(np.mean(rescaled))
-        variances.append(np.var(rescaled))
         scales.append(n) # keep track of the scales we explored within the interval [n_min, n_max]
+        steps.append(step)
         
         n = int(np.ceil(n*s)) # increase aggregation level n with factor s to ensure even spreading of the 
                                 # mean-variance datapoints on the log-log plot
                                 # this makes the fit of the polynomial better adjusted to all scales, rather than biased towards the higher scales
 
-    means = np.array(means)
-    variances = np.array(variances)
+    scales = np.array(scales)
+    steps = np.array(steps)
+    scales.setflags(write=False) # the schedule is shared by all callers, so it should not be modified
+    steps.setflags(write=False)
+
+    return scales, steps
+
+
+def aggregation_scales(n_min, n_max, s=1.1):
+    """
+    Determines the levels of aggregation explored by the adapted allometric aggregation algorithm, together with the step size 
+    with which the aggregated segments of each level advance over the sequence. The schedules are kept in a bounded LRU cache, 
+    since they are the same for every window, patient and notebook using the same parameters.
+
+    :param n_min: minimal level of aggregation
+    :param n_max: maximal level of aggregation
+    :param s: factor controlling the spread of the aggregation levels within the interval [n_min, n_max], default value 1.1
+
+    return: numpy array "scales" containing the levels n within [n_min, n_max], and numpy array "steps" containing the step size for every level
+    """
+
+    scales, steps = _aggregation_scales(n_min, n_max, s)
+
+    return scales.copy(), steps.copy()
+
+
+@instrumentation.instrumented()
+def _polynomial_dimensions(means, variances):
+    """
+    Fits a third-order polynomial to the means and variances in log-log space and derives the fractal dimension for every level of 
+    aggregation from the local slope of this polynomial.
+
+    :param means: numpy array containing the mean of the aggregated segments for every level of aggregation
+    :param variances: numpy array containing the variance of the aggregated segments for every level of aggregation
+
+    return: the fractal dimension for every level of aggregation, and the coefficients of the fitted polynomial (lowest order first)
+    """
 
-    # fit third-order polynomial to the means and variances in log-log space
     fitted_poly = poly.Polynomial.fit(np.log(means), np.log(variances), 3)
     coeff = fitted_poly.convert().coef
 
-    # draw fitted polynomial
-    if (draw):
-        fig, ax = plt.subplots(1)
-        plt.scatter(means, variances)
-        plt.plot(means, np.exp(coeff[0]+coeff[1]*np.log(means)+coeff[2]*np.log(means)**2+coeff[3]*np.log(means)**3), color='red')
-        ax.set_yscale("log")
-        ax.set_xscale("log")
-        plt.xlabel("mean")
-        plt.ylabel("variance")
-    
-    # calculate fractal dimension for every scale in "scales", by obtaining the derivative of the polynomial (which represents the local slope)
+    # calculate fractal dimension for every scale, by obtaining the derivative of the polynomial (which represents the local slope)
     slopes = coeff[1] + 2*coeff[2]*np.log(means) + 3*coeff[3]*np.log(means)**2
     D = 2 - slopes / 2 
-    
-    return D, np.array(scales) # the dimension on index i of "D" corresponds to the scale on index i of "scales"
 
+    return D, coeff
 
-def complexity_evolution(sig, width, step, n_min, n_max):
+
+@instrumentation.instrumented()
+def batched_polynomial_dimensions(means, variances):
+    """
+    Batched version of "_polynomial_dimensions", which fits a third-order polynomial to the means and variances in log-log space for 
+    many windows at once. Just like numpy's Polynomial.fit, the log-means of every window are first mapped onto the interval [-1, 1] 
+    to keep the least-squares problem well conditioned. The least-squares problems of all windows are then solved in one vectorized
+    QR decomposition, after which the coefficients are converted back to the original (unmapped) domain.
+
+    :param means: 2D numpy array containing the mean of the aggregated segments for every window (rows) and every level of aggregation (columns)
+    :param variances: 2D numpy array containing the variance of the aggregated segments for every window (rows) and every level of aggregation (columns)
+
+    return: 2D numpy array containing the fractal dimension for every window and every level of aggregation, and 2D numpy array containing
+            the coefficients of the fitted polynomial for every window (lowest order first)
+    """
+
+    x = np.log(np.asarray(means, dtype=float))
+    y = np.log(np.asarray(variances, dtype=float))
+    deg = 3
+
+    # map the domain [min(x), max(x)] of every window onto the window [-1, 1]: x_mapped = off + scl*x
+    x_min = x.min(axis=1, keepdims=True)
+    x_max = x.max(axis=1, keepdims=True)
+    scl = 2 / (x_max - x_min)
+    off = -(x_max + x_min) / (x_max - x_min)
+    mapped_x = off + scl * x
+    vander = np.ones(x.shape + (deg + 1,)) # one Vandermonde matrix per window, built by repeated multiplication (much faster than np.power)
+    for j in range(1, deg + 1):
+        vander[:, :, j] = vander[:, :, j-1] * mapped_x
+
+    # solve all least-squares problems at once through the QR decomposition of the Vandermonde matrices
+    q, r = np.linalg.qr(vander)
+    mapped = np.linalg.solve(r, np.matmul(np.swapaxes(q, 1, 2), y[:, :, None]))[:, :, 0]
+
+    # convert the coefficients to the original domain: the coefficient of x**k gathers the terms binom(j, k) * off**(j-k) * scl**k
+    # of the expansion of every mapped coefficient j >= k
+    coeff = np.zeros_like(mapped)
+    for j in range(deg + 1):
+        for k in range(j + 1):
+            coeff[:, k] += mapped[:, j] * comb(j, k) * off[:, 0] ** (j - k) * scl[:, 0] ** k
+
+    # calculate fractal dimension for every scale, by obtaining the derivative of the polynomial (which represents the local slope)
+    slopes = coeff[:, [1]] + 2*coeff[:, [2]]*x + 3*coeff[:, [3]]*x**2
+    D = 2 - slopes / 2
+
+    return D, coeff
+
+
+@instrumentation.instrumented()
+def adapted_allometric_aggregation(seq, n_min, n_max, s=1.1, draw=False, return_artifacts=False):
+    """
+    The adapted allometric aggregation algorithm. Returns the fractal dimension of a time series for various scales 
+    and the log-log plot from which these were extracted. We draw attention to the changes that were made compared to the original
+    allometric aggregation algorithm in the comments. 
+
+    :param seq: numpy array of equidistant signal values, in our case 1-minute activity counts sequence
+    :param n_min: minimal level of aggregation
+    :param n_max: maximal level of aggregation
+    :param s: factor controlling the spread of the aggregation levels within the interval [n_min, n_max], default value 1.1
+    :param draw: a boolean indicating whether or not to draw the log-log plot and the estimated polynomial (see "plotting.plot_polynomial_fit"), 
+                 default value False
+    :param return_artifacts: a boolean indicating whether to also return the means, variances and fitted polynomial, from which the log-log 
+                             plot can be drawn later on, default value False
+
+    return: the fractal dimension of the sequence (float) for every level n in scales, and if return_artifacts is set, a dictionary containing 
+            the "means" and "variances" for every level n in scales and the coefficients "coeff" of the fitted polynomial (lowest order first)
+    """
+
+    # the levels of aggregation are spread evenly on a logarithmic scale within [n_min, n_max], and the aggregated
+    # segments of each level are now allowed to overlap (see "aggregation_scales")
+    scales, steps = aggregation_scales(n_min, n_max, s)
+
+    # every segment always contains n samples, except for the last one, which contains at least 15/16*n samples
+    # this ensures a reliable calculation of the mean and variance, avoiding end effects
+    # the sliding window moves forward with steps smaller than n, allowing the segments to overlap
+    means, variances = aggregation_moments(seq, scales, steps)
+
+    # fit third-order polynomial to the means and variances in log-log space, and calculate the fractal dimension for every scale 
+    # in "scales" from the derivative of this polynomial
+    D, coeff = _polynomial_dimensions(means, variances)
+
+    # draw fitted polynomial (see "plotting")
+    if (draw):
+        from lib import plotting
+        plotting.plot_polynomial_fit(means, variances, coeff)
+
+    if (return_artifacts):
+        return D, scales, {"means": means, "variances": variances, "coeff": coeff}
+
+    return D, scales # the dimension on index i of "D" corresponds to the scale on index i of "scales"
+
+
+def _window_moments(counts, starts, stops, scales, steps, incremental):
+    """
+    Calculates the means and variances of the aggregated segments for every window counts[start:stop] and every level of aggregation, 
+    either incrementally for all windows at once or window by window (see "complexity_evolution").
+
+    return: two 2D numpy arrays containing the mean and variance of the aggregated segments, for every window (rows) and every level n in "scales" (columns)
+    """
+
+    # only the part of the sequence that is covered by the windows is needed, this keeps the running sums small when the windows are processed in chunks
+    lo = starts[0] if len(starts) > 0 else 0
+    hi = np.max(stops) if len(stops) > 0 else 0
+    counts = counts[lo:hi]
+    starts = starts - lo
+    stops = stops - lo
+
+    if (incremental):
+        means, variances = sliding_aggregation_moments(counts, starts, stops, scales, steps)
+
+    else:
+        means = []
+        variances = []
+
+        for window in windowing.window_views(counts, starts, stops): # every window is a view on the counts array, no data is copied
+
+            mean, variance = aggregation_moments(window, scales, steps) # aggregation as in adapted_allometric_aggregation
+            means.append(mean)
+            variances.append(variance)
+
+        means = np.array(means).reshape(-1, len(scales))
+        variances = np.array(variances).reshape(-1, len(scales))
+
+    return means, variances
+
+
+def _shared_window_moments(name, shape, starts, stops, scales, steps, incremental):
+    """
+    Runs "_window_moments" in a worker process, on the counts array which is stored in the shared memory block with the given name.
+    """
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        counts = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        result = _window_moments(counts, starts, stops, scales, steps, incremental)
+        del counts # release the buffer before closing the shared memory block
+    finally:
+        shm.close()
+
+    return result
+
+
+def _parallel_window_moments(counts, starts, stops, scales, steps, incremental, n_jobs, backend):
+    """
+    Partitions the windows into consecutive chunks (one per worker), calculates the means and variances of every chunk in a thread or 
+    process pool and reassembles them in the original order of the windows. Threads share the counts array directly, processes attach 
+    to one shared memory copy of it, so the array is never duplicated per worker.
+
+    return: two 2D numpy arrays containing the mean and variance of the aggregated segments, for every window (rows) and every level n in "scales" (columns)
+    """
+
+    if (n_jobs is None or n_jobs < 1):
+        n_jobs = os.cpu_count()
+    chunks = [chunk for chunk in np.array_split(np.arange(len(starts)), n_jobs) if len(chunk) > 0]
+    if (len(chunks) <= 1):
+        return _window_moments(counts, starts, stops, scales, steps, incremental)
+
+    if (backend == "thread"):
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(lambda chunk: _window_moments(counts, starts[chunk], stops[chunk], scales, steps, incremental), chunks))
+
+    elif (backend == "process"):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, counts.nbytes))
+        try:
+            np.ndarray(counts.shape, dtype=float, buffer=shm.buf)[:] = counts
+            with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+                futures = [pool.submit(_shared_window_moments, shm.name, counts.shape, starts[chunk], stops[chunk], scales, steps, incremental) 
+                           for chunk in chunks]
+                results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    else:
+        raise Exception("Unknown type of backend")
+
+    means = np.concatenate([result[0] for result in results])
+    variances = np.concatenate([result[1] for result in results])
+
+    return means, variances
+
+
+def _expand(values, keep, n_windows):
+    """
+    Places the rows calculated for the kept windows back among all windows, the other rows are filled with nan.
+    """
+    expanded = np.full((n_windows,) + np.shape(values)[1:], np.nan)
+    expanded[keep] = values
+    return expanded
+
+
+@instrumentation.instrumented()
+def complexity_evolution(sig, width, step, n_min, n_max, s=1.1, incremental=False, batched_fit=False, n_jobs=1, backend="process", return_artifacts=False, 
+                         min_coverage=None, gaps="mask"):
     """
     The time-dependent complexity method which extracts a list of fractal dimensions for various scales over time.
 
@@ -132,27 +617,131 @@ def complexity_evolution(sig, width, step, n_min, n_max):
     :param step: the step size with which to advance the window. this is described as a string from which a Timedelta can be extracted (e.g. "5 min")
     :param n_min: minimal level of aggregation
     :param n_max: maximal level of aggregation
+    :param s: factor controlling the spread of the aggregation levels within the interval [n_min, n_max], default value 1.1
+    :param incremental: a boolean indicating whether to calculate the means and variances of the aggregated segments for all windows at once, 
+                        by updating running sums as the window slides over the sequence (see "sliding_aggregation_moments"), instead of
+                        applying the adapted allometric aggregation to every window from scratch, default value False
+    :param batched_fit: a boolean indicating whether to fit the polynomials of all windows at once (see "batched_polynomial_dimensions"), 
+                        instead of fitting a polynomial to every window separately, default value False
+    :param n_jobs: number of workers among which the windows are divided in consecutive chunks, default value 1 processes all windows in 
+                   the current process. None or -1 uses one worker per core
+    :param backend: which type of pool to use when n_jobs is not 1. options: 
+        - process: a process pool, in which every worker reads the counts from one shared memory block
+        - thread: a thread pool, in which every worker reads the counts array directly
+    :param return_artifacts: a boolean indicating whether to also return the means, variances and fitted polynomials of all windows, 
+                             default value False
+    :param min_coverage: minimal fraction (between 0 and 1) of the samples within a window which should be present, default value None 
+                         assumes an equidistant sequence without gaps. when set, the missing samples are detected once (see "windowing.regularize") 
+                         and counted as zero activity, and the coverage of every window is calculated from cumulative counts 
+                         (see "windowing.window_coverage"). the windows below the minimal coverage are not calculated. 
+                         note that zero-filled minutes bias the fractal dimensions of the windows which are kept: a gap of a few hours 
+                         changes the variance of the aggregated segments at scales of that order, so any coverage below 100% (in particular 
+                         a low "min_coverage") trades more windows for a bias of D at the larger scales
+    :param gaps: what to do with the windows below the minimal coverage, default value "mask". "drop" requires min_coverage. options:
+        - mask: the windows are kept, with nan fractal dimensions
+        - drop: the windows are left out of the results
+
+    return: list "dimensions", containing the fractal dimension for every level n in "scales", for every timestamp in "timestamps", 
+            if min_coverage is set, an array "coverage" containing the coverage of the window ending at every timestamp, and if 
+            return_artifacts is set, a dictionary containing the 2D arrays "means", "variances" (one row per timestamp, one column per scale) 
+            and "coeff" (the coefficients of the polynomial fitted for every timestamp, lowest order first)
+    """
+
+    if (gaps not in ("mask", "drop")):
+        raise Exception("Unknown type of gaps")
+    if (gaps == "drop" and min_coverage is None):
+        raise Exception("Dropping windows requires min_coverage")
+
+    scales, steps = aggregation_scales(n_min, n_max, s)
+
+    # convert the timestamps to integer positions once, the windows are then taken from the counts array without timestamp lookups
+    if (min_coverage is None):
+        starts, stops, window_ends = windowing.window_bounds(sig.index, width, step)
+        counts = sig["counts"].to_numpy(dtype=float)
+        keep = None
+    else:
+        counts, valid, index = windowing.regularize(sig.index, sig["counts"].to_numpy(dtype=float))
+        starts, stops, window_ends = windowing.window_bounds(index, width, step)
+        coverage = windowing.window_coverage(valid, starts, stops)
+        keep = coverage >= min_coverage
+        if (gaps == "drop"):
+            window_ends, coverage = window_ends[keep], coverage[keep]
+        all_windows = len(starts)
+        starts, stops = starts[keep], stops[keep] # only the windows with enough coverage are calculated
+
+    # the aggregation and the fit are recorded as separate stages when instrumentation is enabled (see "instrumentation.profiling")
+    with instrumentation.stage("complexity.complexity_evolution.aggregation", len(starts)):
+        if (n_jobs == 1):
+            means, variances = _window_moments(counts, starts, stops, scales, steps, incremental)
+        else:
+            means, variances = _parallel_window_moments(counts, starts, stops, scales, steps, incremental, n_jobs, backend)
+
+    with instrumentation.stage("complexity.complexity_evolution.fit", len(starts)):
+        if (batched_fit):
+            dimensions, coeff = batched_polynomial_dimensions(means, variances)
+        else:
+            fits = [_polynomial_dimensions(mean, variance) for mean, variance in zip(means, variances)]
+            dimensions = np.array([fit[0] for fit in fits]).reshape(-1, len(scales))
+            coeff = np.array([fit[1] for fit in fits]).reshape(-1, 4)
+
+    if (keep is not None and gaps == "mask"): # the windows below the minimal coverage get nan fractal dimensions
+        dimensions, means, variances, coeff = [_expand(values, keep, all_windows) for values in [dimensions, means, variances, coeff]]
+
+    timestamps = window_ends.to_pydatetime() # the timestamps indicate the end of the interval for which the fractal dimensions were obtained, 
+                                             # and are returned in the datetime format for easy plotting of the obtained evolution
+
+    results = (np.array(dimensions), np.array(timestamps), scales)
+    if (min_coverage is not None):
+        results += (coverage,)
+    if (return_artifacts):
+        results += ({"means": means, "variances": variances, "coeff": coeff},)
+
+    return results
+
+
+@instrumentation.instrumented()
+def complexity_sweep(sig, widths, step, n_ranges, spreads=(1.1,)):
+    """
+    Extracts the evolution of the fractal dimension over time (see "complexity_evolution") for every combination of window width, 
+    interval of aggregation levels [n_min, n_max] and spreading factor s. The running sums of the aggregated segments are calculated 
+    only once for every level of aggregation n, and are shared by all windows of all widths and by all parameter combinations which 
+    explore that level. Afterwards, the polynomials of all windows of a parameter combination are fitted at once. 
+    The result for every combination is the same as that of "complexity_evolution" with the same parameters. 
+
+    :param sig: dataframe containing the activity counts and the timestamps these correspond to (the start of the 1-minute interval
+                for which these were obtained)
+    :param widths: list of window widths, described as strings from which a Timedelta can be extracted (e.g. ["1 day", "3 days", "7 days"])
+    :param step: the step size with which to advance the windows. this is described as a string from which a Timedelta can be extracted (e.g. "5 min")
+    :param n_ranges: list of tuples (n_min, n_max), the minimal and maximal level of aggregation
+    :param spreads: list of factors s controlling the spread of the aggregation levels within the interval [n_min, n_max], default value (1.1,)
 
-    return: list "dimensions", containing the fractal dimension for every level n in "scales", for every timestamp in "timestamps"
+    return: pandas Series "D" containing the fractal dimensions, indexed by a MultiIndex with the levels "width", "n_min", "n_max", "s", 
+            "timestamp" (the end of the window) and "scale"
     """
 
-    window = pd.Timedelta(width) 
-    start = sig.index[0] # extract timestamp indicating the start of the activity sequence 
-    end = start + window
-    dimensions = []
-    timestamps = []
+    counts = sig["counts"].to_numpy(dtype=float)
+    cs = np.concatenate(([0.0], np.cumsum(counts))) # cs[i] contains the sum of the first i samples
+    bounds = {width: windowing.window_bounds(sig.index, width, step) for width in widths}
+    schedules = {(n_min, n_max, s): aggregation_scales(n_min, n_max, s) for n_min, n_max in n_ranges for s in spreads}
 
-    while(end <= sig.index[-1]): # advance the window until the end of it reaches the end of the counts sequence (do not allow partially filled windows)
+    # the step of a level only depends on n, so every level which is explored by any of the parameter combinations is processed once
+    levels = {}
+    for scales, steps in schedules.values():
+        levels.update(zip(scales, steps))
 
-        D, scales = adapted_allometric_aggregation(np.array(sig[start:end]["counts"]), n_min, n_max, draw=False) # use default value of 1.1 for spreading
-        dimensions.append(D)
-        timestamps.append(end) # keep the timestamp indicating the end of the interval for which the fractal dimensions were obtained
-        start += pd.Timedelta(step) # advance the window
-        end = start + window
+    moments = {} # means and variances of every level n, for every window of every width
+    for n, level_step in sorted(levels.items()):
+        running = _running_segment_sums(cs, n, level_step)
+        for width, (starts, stops, _) in bounds.items():
+            moments[width, n] = _window_segment_moments(cs, running, n, level_step, starts, stops)
 
-    timestamps = pd.to_datetime(timestamps)
-    timestamps = timestamps.to_pydatetime() #  the timestamps are returned in the datetime format for easy plotting of the obtained evolution
+    results = []
+    for width, (starts, stops, window_ends) in bounds.items():
+        for (n_min, n_max, s), (scales, steps) in schedules.items():
+            means = np.stack([moments[width, n][0] for n in scales], axis=1)
+            variances = np.stack([moments[width, n][1] for n in scales], axis=1)
+            dimensions, coeff = batched_polynomial_dimensions(means, variances)
+            index = pd.MultiIndex.from_product([[width], [n_min], [n_max], [s], window_ends, scales], names=["width", "n_min", "n_max", "s", "timestamp", "scale"])
+            results.append(pd.Series(dimensions.ravel(), index=index, name="D"))
 
-    return np.array(dimensions), np.array(timestamps), scales # dimensions contains a list of fractal dimensions for every scale in "scales", for every timestamp 
-                                                              # in "timestamps", with the timestamp indicating the end of the window for which the dimensions were 
-                                                              # calculated
\ No newline at end of file
+    return pd.concat(results)
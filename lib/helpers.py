@@ -1,23 +1,40 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-import matplotlib.dates as mdates
 from scipy.stats.stats import pearsonr
+from lib import windowing
+from lib import binary_cache
+from lib import window_stats
+# matplotlib is only imported within the plotting functions, so the other helpers can be used without it
 
-def read_counts(patient_id):
+def read_counts(patient_id, cache=True):
     """
     Reads in CSV file containing activity counts and puts them in a dataframe, indexed by the timestamps.
 
     :param patient_id: which patient's activity counts are read from memory
+    :param cache: a boolean indicating whether to read the binary cache of the CSV file when it exists (see "cache_counts"), default value True
 
     return: a Pandas dataframe containing the 1-minute counts sequence, indexed by the timestamps (indicating the start of the interval
     represented by the counts value)
     """
     filename = "data/activity/activity"+str(patient_id)+".csv"
+    if (cache and binary_cache.is_cached(filename)):
+        return binary_cache.read_cache(filename)
     counts_df = pd.read_csv(filename, names=["Time", "counts"], parse_dates=True, index_col="Time", skiprows=1)
     return counts_df
 
 
+def cache_counts(patient_id):
+    """
+    Converts the CSV file containing the activity counts of a patient into a binary cache next to it (see "binary_cache.write_cache"), 
+    which is read by "read_counts" from then on, until the CSV file changes. The counts are stored in double precision, so the results 
+    obtained from the cache are identical to those obtained from the CSV file.
+
+    :param patient_id: which patient's activity counts are converted
+    """
+    filename = "data/activity/activity"+str(patient_id)+".csv"
+    binary_cache.write_cache(filename, [read_counts(patient_id, cache=False)], dtype=np.float64)
+
+
 def calculate_mean_std(df):
     """
     Calculates the mean and std of the daily activity counts. 
@@ -27,14 +44,8 @@ def calculate_mean_std(df):
 
     return: mean and std of the daily counts
     """
-    counts = df["counts"]
     day = 24*60 # one day is simply defined as this amount of 1-minute intervals
-    daily_counts = []
-    for i in range(len(counts)//day): # the last day is not counted, as it will not be full
-        start = i*day
-        end = (i+1)*day
-        daily = counts.iloc[start:end]
-        daily_counts.append(daily.sum()) # daily sum of counts
+    daily_counts = window_stats.daily_totals(df["counts"], day) # daily sum of counts, the last day is not counted, as it will not be full
     return np.mean(daily_counts), np.std(daily_counts)
 
 
@@ -45,6 +56,8 @@ def visualize_across_scales(scales, fractal_dim):
     :param scales: range of scales for which the fractal dimension was calculated
     :param fractal_dim: fractal dimensions corresponding to the scale on the same index in param scales
     """
+
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(1, figsize=(10,5))
     plt.plot(np.array(scales)/60, fractal_dim)
     plt.gca()
@@ -68,6 +81,8 @@ def compare_static_dims(scales, fractal_dim_dict):
                              - third week: "week3"
                              each fractal dimension corresponds to the scale on the same index in param scales
     """
+
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(1)
     plt.plot(np.array(scales[18:])/60, fractal_dim_dict["full"][18:], label="global")
     plt.plot(np.array(scales[18:])/60, fractal_dim_dict["week1"][18:], label="week 1")
@@ -96,33 +111,43 @@ def plot_complexity_evolution(complexity, time, static_dict, functioning, height
     :param height_legend: decides at which height to place the legend, so it doesn't overlap with the plot. should be float between [1.0, 1.5]
     """
 
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
     idx = 35
     scale = "3h"
+
+    # the week boundaries and text positions are looked up by their timestamp, relative to the end of the first window, so they do not
+    # depend on the step size of the evolution or on windows which were dropped (see "complexity_evolution" with min_coverage)
+    time = np.array(time)
+    at = lambda offset: time[min(len(time) - 1, np.searchsorted(pd.to_datetime(time), time[0] + pd.Timedelta(offset)))]
+    week2 = at("4 days 4 hours")
+    week3 = at("11 days 4 hours")
     
     plt.figure(figsize=(20,5))
     
     color = np.array(["forestgreen", "orange", "indianred"])
-    plt.axvspan(time[0], time[4*12+24*12*4], facecolor=color[functioning[0]], alpha=0.07)
-    plt.axvspan(time[4*12+24*12*4], time[4*12+24*12*4+24*12*7], facecolor=color[functioning[1]], alpha=0.07)
-    plt.axvspan(time[4*12+24*12*4+24*12*7], time[-1], facecolor=color[functioning[2]], alpha=0.07)
+    plt.axvspan(time[0], week2, facecolor=color[functioning[0]], alpha=0.07)
+    plt.axvspan(week2, week3, facecolor=color[functioning[1]], alpha=0.07)
+    plt.axvspan(week3, time[-1], facecolor=color[functioning[2]], alpha=0.07)
     
     plt.axvline(time[0], linestyle="dashdot", linewidth=1, color="black")
-    plt.axvline(time[4*12+24*12*4], linestyle="dashdot", linewidth=1, color="black")
-    plt.axvline(time[4*12+24*12*4+24*12*7], linestyle="dashdot", linewidth=1, color="black")
+    plt.axvline(week2, linestyle="dashdot", linewidth=1, color="black")
+    plt.axvline(week3, linestyle="dashdot", linewidth=1, color="black")
     plt.axvline(time[-1], linestyle="dashdot", linewidth=1, color="black")
     
     plt.plot(time, complexity[:,idx])
     
-    plt.hlines(y=static_dict["week1"][idx], xmin=time[0], xmax=time[4*12+24*12*4], linewidth=1.5, label="Week 1: "+str(np.round(static_dict["week1"][idx+1], 3)), linestyle="dashed", color="black")
-    plt.hlines(y=static_dict["week2"][idx], xmin=time[4*12+24*12*4], xmax=time[4*12+24*12*4+24*12*7], linewidth=1.5, label="Week 2: "+str(np.round(static_dict["week2"][idx+1], 3)), linestyle="dashed", color="black")
-    plt.hlines(y=static_dict["week3"][idx], xmin=time[4*12+24*12*4+24*12*7], xmax=time[-1], linewidth=1.5, label="Week 3: "+str(np.round(static_dict["week3"][idx+1], 3)), linestyle="dashed", color="black")
+    plt.hlines(y=static_dict["week1"][idx], xmin=time[0], xmax=week2, linewidth=1.5, label="Week 1: "+str(np.round(static_dict["week1"][idx+1], 3)), linestyle="dashed", color="black")
+    plt.hlines(y=static_dict["week2"][idx], xmin=week2, xmax=week3, linewidth=1.5, label="Week 2: "+str(np.round(static_dict["week2"][idx+1], 3)), linestyle="dashed", color="black")
+    plt.hlines(y=static_dict["week3"][idx], xmin=week3, xmax=time[-1], linewidth=1.5, label="Week 3: "+str(np.round(static_dict["week3"][idx+1], 3)), linestyle="dashed", color="black")
     
     ax = plt.gca()
     
     description = ["Best week", "Average week", "Worst week"]
-    t = ax.text(time[30*12], height_legend, "Week 1: "+str(np.round(static_dict["week1"][idx+1], 3))+"\n"+description[functioning[0]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
-    t = ax.text(time[24*12*7], height_legend, "Week 2: "+str(np.round(static_dict["week2"][idx+1], 3))+"\n"+description[functioning[1]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
-    t = ax.text(time[24*12*14-100], height_legend, "Week 3: "+str(np.round(static_dict["week2"][idx+1], 3))+"\n"+description[functioning[2]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
+    t = ax.text(at("30 hours"), height_legend, "Week 1: "+str(np.round(static_dict["week1"][idx+1], 3))+"\n"+description[functioning[0]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
+    t = ax.text(at("7 days"), height_legend, "Week 2: "+str(np.round(static_dict["week2"][idx+1], 3))+"\n"+description[functioning[1]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
+    t = ax.text(at("13 days 15 hours 40 min"), height_legend, "Week 3: "+str(np.round(static_dict["week2"][idx+1], 3))+"\n"+description[functioning[2]], size=12, bbox=dict(boxstyle="round,pad=0.4", fc="white", ec="grey", lw=1, alpha=0.5))
     
     plt.ylim(1,1.5)
     plt.grid(linestyle="--")
@@ -154,26 +179,16 @@ def sliding_window_activity(sig, width, step):
     return: list "aggregated_activity", containing the total counts enclosed within the window ending at the corresponding timestamp in "timestamps"
     """
 
-    window = pd.Timedelta(width)
-    start = sig.index[0]
-    end = start + window
-    aggregated_activity = []
-    timestamps = []
-    
-    while(end <= sig.index[-1]): 
-        count_sum = sig["counts"][start:end].sum()
-        aggregated_activity.append(count_sum)
-        timestamps.append(end)
-        start += pd.Timedelta(step)
-        end = start + window
+    # the windows are the same as in "complexity_evolution", their sums are differences of one cumulative sum of the counts
+    starts, stops, window_ends = windowing.window_bounds(sig.index, width, step)
+    aggregated_activity = window_stats.window_sums(sig["counts"].to_numpy(dtype=float), starts, stops)
 
-    timestamps = pd.to_datetime(timestamps)
-    timestamps = timestamps.to_pydatetime()
+    timestamps = window_ends.to_pydatetime()
 
     return np.array(aggregated_activity), np.array(timestamps)
 
 
-def plot_activity_complexity(evol_compl, evol_activity, timestamps):
+def plot_activity_complexity(evol_compl, evol_activity, timestamps, scale_idx=35, label="3 hour complexity"):
 
     """
     Plots the evolution of the fractal dimension over time for a 3-hour scale. Compares this to the corresponding evolution of the summed activity
@@ -184,11 +199,15 @@ def plot_activity_complexity(evol_compl, evol_activity, timestamps):
     :param evol_activity: 1D-array of summed activity counts, representing the intensity of activity within consecutive 3-day windows
     :param timestamps: 1D-array of timestamps (datetime objects) indicating the end of the 3-day window for which each range of fractal dimensions 
                        in the "evol_compl" matrix and the activity counts in the "evol_activity" array were obtained
+    :param scale_idx: index of the scale (column of "evol_compl") to plot, default value 35 (the 3 hour scale for n_min=1, n_max=9*60, s=1.1)
+    :param label: label of the plotted complexity evolution, default value "3 hour complexity"
     """
 
+    import matplotlib.pyplot as plt
+
     fig, ax1 = plt.subplots(figsize=(20, 5))
 
-    ax1.plot(timestamps, evol_compl[:,35], label="3 hour complexity", color="tab:blue")
+    ax1.plot(timestamps, evol_compl[:,scale_idx], label=label, color="tab:blue")
     ax1.set_xlabel("date")
     ax1.set_ylabel("fractal dimension")
     ax1.set_ylim(1, 1.5)
@@ -204,24 +223,29 @@ def plot_activity_complexity(evol_compl, evol_activity, timestamps):
     fig.tight_layout()
     plt.show()
 
-def scatter_activity_complexity(evol_compl, evol_activity):
+def scatter_activity_complexity(evol_compl, evol_activity, scale_idx=35, sample_every=96):
     """
     Sample both the complexity evolution signal (3 hour scale) and the activity evolution signal three times a day, and compare the calculate the Pearson 
-    correlation between the corresponding samples. Also visualize the scatter plot of this relation. 
+    correlation between the corresponding samples. Also visualize the scatter plot of this relation. To correlate all scales with the daily survey 
+    features as well, see "survey.survey_correlations".
 
     :param evol_compl: 2D-array of fractal dimensions (contains an array of fractal dimensions for various scales, for each timestamp in "timestamps"),
                        representing the evolution of the fractal dimension of the activity counts within consecutive 3-day windows
     :param evol_activity: 1D-array of summed activity counts, representing the intensity of activity within consecutive 3-day windows, aligned with the 
                           corresponding fractal dimensions in "evol_compl"
+    :param scale_idx: index of the scale (column of "evol_compl") to correlate, default value 35 (the 3 hour scale for n_min=1, n_max=9*60, s=1.1)
+    :param sample_every: number of timestamps between two samples, default value 96 samples every 8 hours for 5-minute steps
 
     return: Pearson correlation coefficient for the relation between the 3-day activity evolution and the 3-day complexity evolution (both signals 
             sampled 3 times a day)
     """
 
+    import matplotlib.pyplot as plt
+
     plt.figure()
 
-    x = evol_compl[:,35][::96] # take a sample every 8x12 datapoints (twelve 5-minute intervals in an hour, three 8-hour segments in a day)
-    y = evol_activity[::96]
+    x = evol_compl[:,scale_idx][::sample_every] # by default a sample every 8x12 datapoints (twelve 5-minute intervals in an hour, three 8-hour segments in a day)
+    y = evol_activity[::sample_every]
 
     plt.scatter(x, y)
     plt.xlabel("fractal dimension")
@@ -0,0 +1,217 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_enabled = False # instrumentation is opt-in, when disabled an instrumented function costs a single flag check
+_records = {}
+_lock = threading.Lock()
+
+
+def enable():
+    """
+    Starts recording the timings, call counts and array sizes of the instrumented functions and stages.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Stops recording. The records collected so far are kept until "reset" is called.
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """
+    return: a boolean indicating whether the instrumented functions and stages are currently being recorded
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Removes all records collected so far.
+    """
+    with _lock:
+        _records.clear()
+
+
+@contextmanager
+def profiling(clear=True):
+    """
+    Context manager which records the instrumented functions and stages executed within it, e.g.
+
+        with instrumentation.profiling():
+            activity_counts.activity_counts_pipeline(filename)
+        instrumentation.dump_json("profile.json")
+
+    Only the calls made in the current process are recorded, work done in the workers of a process pool (n_jobs != 1 with the
+    process backend) is not included.
+
+    :param clear: a boolean indicating whether to remove the records of earlier runs first, default value True
+    """
+
+    global _enabled
+    previous = _enabled
+    if (clear):
+        reset()
+    _enabled = True
+    try:
+        yield
+    finally:
+        _enabled = previous
+
+
+def _size(obj):
+    """
+    Number of rows of an array, Series or dataframe, 0 for anything else. For a tuple (e.g. multiple return values) the size of its first
+    element is used, for a list (e.g. of chunks) the total number of rows of its elements.
+    """
+
+    if (isinstance(obj, tuple)):
+        return _size(obj[0]) if len(obj) > 0 else 0
+    if (isinstance(obj, list)):
+        return sum(_size(item) for item in obj)
+    shape = getattr(obj, "shape", None)
+    if (shape is not None):
+        return int(shape[0]) if len(shape) > 0 else 1
+    return 0
+
+
+def _record(name, elapsed, in_size, out_size):
+    """
+    Adds one call to the record of a function or stage.
+    """
+
+    with _lock:
+        record = _records.get(name)
+        if (record is None):
+            record = _records[name] = {"calls": 0, "total_time": 0.0, "max_time": 0.0, "in_size": 0, "out_size": 0}
+        record["calls"] += 1
+        record["total_time"] += elapsed
+        record["max_time"] = max(record["max_time"], elapsed)
+        record["in_size"] += in_size
+        record["out_size"] += out_size
+
+
+def instrumented(name=None):
+    """
+    Decorator which records the wall time, the number of calls and the size of the first argument and of the result (number of rows,
+    see "report") of a function while instrumentation is enabled.
+
+    :param name: name under which the function is recorded, default value None uses "<module>.<function>" (without the "lib." prefix)
+    """
+
+    def decorator(func):
+        label = name if name is not None else func.__module__.replace("lib.", "", 1) + "." + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if (not _enabled):
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            _record(label, elapsed, _size(args[0]) if len(args) > 0 else 0, _size(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def stage(name, size=0):
+    """
+    Context manager which records the wall time of a block of code (a stage within an instrumented function) while instrumentation
+    is enabled, e.g. the aggregation and the polynomial fit within "complexity_evolution".
+
+    :param name: name under which the stage is recorded
+    :param size: size of the input of the stage (e.g. the number of windows), default value 0
+
+    return: dictionary in which the key "size" can be updated within the block, when the size is only known afterwards (e.g. the number 
+            of rows of a parsed chunk)
+    """
+
+    info = {"size": size}
+    if (not _enabled):
+        yield info
+        return
+
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        _record(name, time.perf_counter() - start, info["size"], 0)
+
+
+@contextmanager
+def peak_memory():
+    """
+    Context manager which measures the peak memory allocated by the code executed within it (as traced by tracemalloc, so memory-mapped 
+    files are not included), e.g.
+
+        with instrumentation.peak_memory() as memory:
+            activity_counts.activity_counts_pipeline(filename, lean=True)
+        print(memory["peak"])
+
+    Tracing slows down the code, so the timings recorded at the same time are not representative.
+
+    return: dictionary in which the key "peak" is set to the peak memory (in bytes) when the block exits
+    """
+
+    memory = {"peak": None}
+    tracing = tracemalloc.is_tracing()
+    if (tracing):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    else:
+        tracemalloc.start()
+        baseline = 0
+    try:
+        yield memory
+    finally:
+        memory["peak"] = tracemalloc.get_traced_memory()[1] - baseline
+        if (not tracing):
+            tracemalloc.stop()
+
+
+def report():
+    """
+    Summarizes the records collected so far. The time of a function includes the time of the instrumented functions and stages it calls.
+
+    return: dictionary with the keys "enabled" and "stages", the latter mapping the name of every recorded function or stage to a dictionary
+            with the keys:
+        - calls: number of calls
+        - total_time, mean_time, max_time: total, mean and maximal wall time per call (in seconds)
+        - in_size, out_size: total number of rows of the first argument and of the result over all calls (e.g. samples or windows)
+    """
+
+    with _lock:
+        stages = {name: dict(record, mean_time=record["total_time"] / record["calls"]) for name, record in _records.items()}
+
+    return {"enabled": _enabled, "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["total_time"]))}
+
+
+def dump_json(path=None, indent=2):
+    """
+    Dumps the report (see "report") as JSON.
+
+    :param path: path of the JSON file to write, default value None returns the JSON string instead
+    :param indent: indentation of the JSON output, default value 2
+
+    return: the JSON string if no path was given
+    """
+
+    dumped = json.dumps(report(), indent=indent)
+    if (path is None):
+        return dumped
+
+    with open(path, "w") as f:
+        f.write(dumped)
@@ -0,0 +1,162 @@
+import pandas as pd
+import numpy as np
+from lib import complexity
+
+class ComplexityMonitor:
+    """
+    Online version of "complexity.complexity_evolution", which follows the fractal dimensions of a stream of activity counts in near real time.
+    New counts are appended one by one or in batches, and the fractal dimensions (for every scale) of the window which ends at the latest
+    appended sample are available at any time, without recomputing the history.
+
+    Just like in "complexity.sliding_aggregation_moments", running sums and sums of squares of the aggregated segments are kept for every
+    level of aggregation n, separately for every offset of the segments modulo their step. Appending a sample adds the segment of n samples
+    which now ends at the new sample, and removes the segment which starts at the sample that dropped out of the window, so the work per
+    appended sample is proportional to the number of scales. The cumulative sum of the counts within the current window is kept in a ring
+    buffer. To avoid the accumulation of rounding errors, the running sums are recalculated from the ring buffer at regular intervals.
+    """
+
+    def __init__(self, width, n_min, n_max, s=1.1, sampling="1 min", resync=None):
+        """
+        :param width: width of the window, described as a string from which a Timedelta can be extracted (e.g. "3 days"). just like in
+                      "complexity_evolution", the window includes both its first and last timestamp, so it contains width/sampling + 1 samples
+        :param n_min: minimal level of aggregation
+        :param n_max: maximal level of aggregation
+        :param s: factor controlling the spread of the aggregation levels within the interval [n_min, n_max], default value 1.1
+        :param sampling: the time between two consecutive counts, described as a string from which a Timedelta can be extracted, default value "1 min"
+        :param resync: number of appended samples after which the running sums are recalculated, default value None uses the window length
+        """
+
+        self.length = int(pd.Timedelta(width) / pd.Timedelta(sampling)) + 1 # number of samples in a window
+        self.scales, self.steps = complexity.aggregation_scales(n_min, n_max, s)
+        self.resync = resync if resync is not None else self.length
+
+        self._size = self.length + 2 # the ring buffer holds the cumulative sums at positions t-length-1, ..., t
+        self._cs = np.zeros(self._size) # self._cs[p % self._size] is the sum of the first p samples (up to a constant)
+        self._t = 0 # number of appended samples
+        self._offsets = np.concatenate(([0], np.cumsum(self.steps)[:-1])) # the sums of level k start at self._offsets[k]
+        self._full = self.scales <= self.length # levels which fit within the window at least once
+        self._shift = np.zeros(len(self.scales)) # the segment sums of every level are centered for a numerically stable variance
+        self._sums = np.zeros(np.sum(self.steps))
+        self._sums_sq = np.zeros(np.sum(self.steps))
+
+    @property
+    def ready(self):
+        """
+        A boolean indicating whether the window is completely filled, so the fractal dimensions can be calculated.
+        """
+        return self._t >= self.length
+
+    def append(self, values, emit="last"):
+        """
+        Appends one or more counts to the stream.
+
+        :param values: a single count, or a sequence of consecutive counts
+        :param emit: which fractal dimensions to return. options:
+            - last: the fractal dimensions of the window ending at the last appended sample, or None if the window is not filled yet
+            - all: a 2D numpy array containing the fractal dimensions of the windows ending at every appended sample for which the window
+                   was filled (one row per sample)
+            - none: nothing is returned, the fractal dimensions can be calculated later on with "dimensions"
+
+        return: the fractal dimensions for every level n in "scales", as selected by "emit"
+        """
+
+        dimensions = []
+        for value in np.atleast_1d(np.asarray(values, dtype=float)):
+            self._push(value)
+            if (emit == "all" and self.ready):
+                dimensions.append(self.dimensions())
+
+        if (emit == "all"):
+            return np.array(dimensions).reshape(-1, len(self.scales))
+        elif (emit == "last"):
+            return self.dimensions() if self.ready else None
+        elif (emit == "none"):
+            return None
+        else:
+            raise Exception("Unknown type of emit")
+
+    def moments(self):
+        """
+        Calculates the means and variances of the aggregated segments within the current window, for every level n in "scales".
+
+        return: two numpy arrays containing the mean and variance of the aggregated segments, for every level n in "scales"
+        """
+
+        t = self._t
+        start = max(0, t - self.length) # the window contains the samples start, ..., t-1
+        length = t - start
+
+        # the same number of full segments and cut-off last segment as in "complexity.aggregation_moments"
+        n_full = np.where(length >= self.scales, (length - self.scales) // self.steps + 1, 0)
+        n_segments = np.maximum(0, -(-(length - self.scales + self.steps) // self.steps))
+        index = self._offsets + start % self.steps # the segments of the window start at start, start+step, ...
+        sum_full = self._sums[index]
+        sum_sq_full = self._sums_sq[index]
+
+        last = np.minimum(start + n_full * self.steps, t)
+        partial = np.where(n_segments > n_full, self._cs[t % self._size] - self._cs[last % self._size] - self._shift, 0.0)
+
+        with np.errstate(invalid="ignore", divide="ignore"): # levels without any segments get a nan mean and variance
+            mean = (sum_full + partial) / n_segments
+            variance = np.maximum(0.0, (sum_sq_full + partial ** 2) / n_segments - mean ** 2)
+
+        return self._shift + mean, variance
+
+    def dimensions(self):
+        """
+        Calculates the fractal dimensions of the current window, by fitting the polynomial in log-log space as in "complexity_evolution".
+
+        return: numpy array containing the fractal dimension for every level n in "scales"
+        """
+
+        means, variances = self.moments()
+        D, _ = complexity.batched_polynomial_dimensions(means[None, :], variances[None, :])
+
+        return D[0]
+
+    def _push(self, value):
+        """
+        Appends a single count: updates the ring buffer and adds/removes the segments entering/leaving the window, for every level at once.
+        """
+
+        t = self._t + 1
+        self._cs[t % self._size] = self._cs[(t - 1) % self._size] + value
+        self._t = t
+
+        # the segment of n samples ending at the new sample enters the window
+        j = t - self.scales
+        entering = self._full & (j >= 0)
+        segment = self._cs[t % self._size] - self._cs[j[entering] % self._size] - self._shift[entering]
+        index = self._offsets[entering] + j[entering] % self.steps[entering]
+        self._sums[index] += segment
+        self._sums_sq[index] += segment ** 2
+
+        # the segment starting at the sample which dropped out of the window leaves it
+        j = t - 1 - self.length
+        if (j >= 0):
+            segment = self._cs[(j + self.scales[self._full]) % self._size] - self._cs[j % self._size] - self._shift[self._full]
+            index = self._offsets[self._full] + j % self.steps[self._full]
+            self._sums[index] -= segment
+            self._sums_sq[index] -= segment ** 2
+
+        if (t % self.resync == 0):
+            self._recalculate()
+
+    def _recalculate(self):
+        """
+        Recalculates the running sums of all segments within the current window from the ring buffer, centering the segment sums of every level
+        around their current mean. The ring buffer is rebased to the start of the window, so the cumulative sums stay small.
+        """
+
+        t = self._t
+        start = max(0, t - self.length)
+        positions = np.arange(start, t + 1)
+        self._cs[positions % self._size] -= self._cs[start % self._size]
+
+        for k, (n, step) in enumerate(zip(self.scales, self.steps)):
+            j = np.arange(start, t - n + 1) # start of every full segment within the window
+            segments = self._cs[(j + n) % self._size] - self._cs[j % self._size]
+            self._shift[k] = np.mean(segments) if len(segments) > 0 else 0.0
+            segments = segments - self._shift[k]
+            self._sums[self._offsets[k]:self._offsets[k]+step] = np.bincount(j % step, weights=segments, minlength=step)
+            self._sums_sq[self._offsets[k]:self._offsets[k]+step] = np.bincount(j % step, weights=segments ** 2, minlength=step)
@@ -0,0 +1,47 @@
+"""
+Log-log plots of the fits of the complexity methods. Matplotlib is only imported when one of these functions is called, so the complexity 
+methods can be used without it.
+"""
+
+import numpy as np
+
+def plot_allometric_fit(means, variances, slope, intercept):
+    """
+    Draws the log-log plot of the means and variances obtained by the original allometric aggregation algorithm, together with the fitted line.
+
+    :param means: numpy array containing the mean of the aggregated blocks for every level of aggregation
+    :param variances: numpy array containing the variance of the aggregated blocks for every level of aggregation
+    :param slope: slope of the line fitted to the means and variances in log-log space
+    :param intercept: intercept of the line fitted to the means and variances in log-log space
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(1)
+    plt.scatter(means, variances)
+    plt.plot(means, np.exp(intercept) * means ** slope, color='red')
+    ax.set_yscale("log")
+    ax.set_xscale("log")
+    plt.xlabel("mean")
+    plt.ylabel("variance")
+
+
+def plot_polynomial_fit(means, variances, coeff):
+    """
+    Draws the log-log plot of the means and variances obtained by the adapted allometric aggregation algorithm, together with the fitted
+    third-order polynomial.
+
+    :param means: numpy array containing the mean of the aggregated segments for every level of aggregation
+    :param variances: numpy array containing the variance of the aggregated segments for every level of aggregation
+    :param coeff: coefficients of the polynomial fitted to the means and variances in log-log space (lowest order first)
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(1)
+    plt.scatter(means, variances)
+    plt.plot(means, np.exp(coeff[0]+coeff[1]*np.log(means)+coeff[2]*np.log(means)**2+coeff[3]*np.log(means)**3), color='red')
+    ax.set_yscale("log")
+    ax.set_xscale("log")
+    plt.xlabel("mean")
+    plt.ylabel("variance")
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+import pandas as pd
+import numpy as np
+from lib import complexity
+from lib import windowing
+
+DIRECTORY = "results.cache" # default location of the store, relative to the root of the repository (like the "data" folder)
+MAX_SIZE = 2**30 # default maximal size of the store in bytes, the least recently used entries are evicted beyond it
+SAFE_KWARGS = ["incremental", "batched_fit", "n_jobs", "backend"] # arguments of "complexity_evolution" which do not change the results
+
+
+@lru_cache(maxsize=1)
+def code_version():
+    """
+    Identifies the version of the code which calculates the fractal dimensions, as a hash of the source of the modules involved, so stored
+    results are no longer used as soon as that code changes.
+
+    return: hexadecimal hash string
+    """
+
+    digest = hashlib.sha256()
+    for module in [complexity, windowing]:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()[:16]
+
+
+def result_key(sig, width, step, n_min, n_max, s=1.1):
+    """
+    Determines the key under which the evolution of the fractal dimension of a counts sequence is stored, as a hash of the counts, their
+    timestamps, the parameters of "complexity_evolution" and the version of the code (see "code_version").
+
+    :param sig: dataframe containing the activity counts, indexed by the timestamps
+    :param width, step, n_min, n_max, s: the parameters of "complexity_evolution"
+
+    return: hexadecimal hash string
+    """
+
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(sig["counts"].to_numpy(dtype=float)).tobytes())
+    digest.update(np.ascontiguousarray(sig.index.asi8).tobytes())
+    digest.update(json.dumps(_params(width, step, n_min, n_max, s), sort_keys=True).encode())
+    digest.update(code_version().encode())
+
+    return digest.hexdigest()[:32]
+
+
+def _params(width, step, n_min, n_max, s):
+    """
+    The parameters of an entry in a canonical form, so e.g. "3 days" and "72h" give the same key.
+    """
+    return {"width": str(pd.Timedelta(width)), "step": str(pd.Timedelta(step)), "n_min": int(n_min), "n_max": int(n_max), "s": float(s)}
+
+
+def _entry_size(path):
+    """
+    Total size in bytes of the files of an entry.
+    """
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def load(key, directory=DIRECTORY, mmap=True):
+    """
+    Loads a stored evolution of the fractal dimension, and marks it as recently used.
+
+    :param key: the key of the entry (see "result_key")
+    :param directory: the directory of the store, default value "results.cache"
+    :param mmap: a boolean indicating whether to memory-map the fractal dimensions instead of reading them, default value True. the map is 
+                 copy-on-write, so the results can be modified like those of a cache miss without changing the store
+
+    return: the same "dimensions", "timestamps" and "scales" as returned by "complexity_evolution", or None if the entry is not stored
+    """
+
+    path = os.path.join(directory, key)
+    if (not os.path.exists(os.path.join(path, "meta.json"))):
+        return None
+
+    os.utime(os.path.join(path, "meta.json")) # the modification time of the meta data marks the last use of the entry
+    dimensions = np.load(os.path.join(path, "dimensions.npy"), mmap_mode="c" if mmap else None)
+    timestamps = np.load(os.path.join(path, "timestamps.npy"))
+    scales = np.load(os.path.join(path, "scales.npy"))
+
+    return dimensions, np.array(pd.DatetimeIndex(timestamps).to_pydatetime()), scales
+
+
+def save(key, dimensions, timestamps, scales, params, directory=DIRECTORY, max_size=MAX_SIZE):
+    """
+    Stores an evolution of the fractal dimension as .npy files, after which the least recently used entries are evicted until the store
+    is no larger than "max_size". The entry is written to a temporary directory first, so a partially written entry is never loaded.
+
+    :param key: the key of the entry (see "result_key")
+    :param dimensions, timestamps, scales: the results of "complexity_evolution"
+    :param params: dictionary with the parameters of "complexity_evolution", stored in the meta data to be listed by "list_entries"
+    :param directory: the directory of the store, default value "results.cache"
+    :param max_size: maximal size of the store in bytes, default value 1 GiB. None disables the eviction
+    """
+
+    path = os.path.join(directory, key)
+    tmp = path + ".tmp" + str(os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+
+    np.save(os.path.join(tmp, "dimensions.npy"), np.asarray(dimensions, dtype=float))
+    np.save(os.path.join(tmp, "timestamps.npy"), pd.to_datetime(timestamps).values.astype("datetime64[ns]"))
+    np.save(os.path.join(tmp, "scales.npy"), np.asarray(scales))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(dict(params, key=key, code_version=code_version(), created=time.time()), f)
+
+    if (os.path.exists(path)):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+    if (max_size is not None):
+        evict(max_size, directory)
+
+
+def cached_complexity_evolution(sig, width, step, n_min, n_max, s=1.1, directory=DIRECTORY, max_size=MAX_SIZE, mmap=True, **kwargs):
+    """
+    Version of "complexity_evolution" which stores its results on disk, keyed by the counts and the parameters (see "result_key").
+    When the same counts and parameters were processed before by the same version of the code, the stored results are loaded instead
+    of recalculated.
+
+    :param sig: dataframe containing the activity counts and the timestamps these correspond to
+    :param width, step, n_min, n_max, s: the parameters of "complexity_evolution"
+    :param directory: the directory of the store, default value "results.cache"
+    :param max_size: maximal size of the store in bytes, default value 1 GiB
+    :param mmap: a boolean indicating whether to memory-map stored fractal dimensions, default value True
+    :param kwargs: the arguments of "complexity_evolution" which do not change the results ("incremental", "batched_fit", "n_jobs" and 
+                   "backend"), default the incremental aggregation and the batched polynomial fit are used. other arguments (e.g. "min_coverage" 
+                   or "return_artifacts") change what is returned and are not part of the key, so these are rejected
+
+    return: the same "dimensions", "timestamps" and "scales" as "complexity_evolution"
+    """
+
+    for name in kwargs:
+        if (name not in SAFE_KWARGS):
+            raise Exception("Unsupported argument of the stored complexity_evolution: " + name)
+
+    key = result_key(sig, width, step, n_min, n_max, s)
+    result = load(key, directory, mmap)
+    if (result is not None):
+        return result
+
+    kwargs = dict({"incremental": True, "batched_fit": True}, **kwargs)
+    dimensions, timestamps, scales = complexity.complexity_evolution(sig, width, step, n_min, n_max, s, **kwargs)
+    save(key, dimensions, timestamps, scales, _params(width, step, n_min, n_max, s), directory, max_size)
+
+    return dimensions, timestamps, scales
+
+
+def warm(signals, param_sets, directory=DIRECTORY, max_size=MAX_SIZE, **kwargs):
+    """
+    Fills the store with the evolutions of the fractal dimension of a number of counts sequences, for every set of parameters, so later
+    calls of "cached_complexity_evolution" only need to load them. Entries which are already stored are not recalculated.
+
+    :param signals: list of dataframes containing the activity counts, indexed by the timestamps
+    :param param_sets: list of dictionaries, each containing the keys "width", "step", "n_min", "n_max" and optionally "s"
+    :param directory: the directory of the store, default value "results.cache"
+    :param max_size: maximal size of the store in bytes, default value 1 GiB
+    :param kwargs: other arguments of "complexity_evolution" which do not change the results (see "cached_complexity_evolution")
+
+    return: list of the keys of all entries, in the order of "signals" and "param_sets"
+    """
+
+    keys = []
+    for sig in signals:
+        for params in param_sets:
+            params = dict({"s": 1.1}, **params)
+            cached_complexity_evolution(sig, params["width"], params["step"], params["n_min"], params["n_max"], params["s"],
+                                        directory, max_size, **kwargs)
+            keys.append(result_key(sig, params["width"], params["step"], params["n_min"], params["n_max"], params["s"]))
+
+    return keys
+
+
+def list_entries(directory=DIRECTORY):
+    """
+    Lists the entries of the store.
+
+    :param directory: the directory of the store, default value "results.cache"
+
+    return: dataframe with one row per entry, sorted from least to most recently used, with the columns "key", "width", "step", "n_min",
+            "n_max", "s", "code_version", "created", "last_used" and "size" (in bytes). entries of older versions of the code are listed too
+    """
+
+    entries = []
+    if (os.path.exists(directory)):
+        for key in os.listdir(directory):
+            meta_file = os.path.join(directory, key, "meta.json")
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+                meta["last_used"] = os.path.getmtime(meta_file)
+                meta["size"] = _entry_size(os.path.join(directory, key))
+            except FileNotFoundError: # an entry which is being written (or removed by another process) is skipped
+                continue
+            entries.append(meta)
+
+    columns = ["key", "width", "step", "n_min", "n_max", "s", "code_version", "created", "last_used", "size"]
+    entries = pd.DataFrame(entries, columns=columns).sort_values("last_used", ignore_index=True)
+    entries["created"] = pd.to_datetime(entries["created"], unit="s")
+    entries["last_used"] = pd.to_datetime(entries["last_used"], unit="s")
+
+    return entries
+
+
+def evict(max_size, directory=DIRECTORY):
+    """
+    Removes the least recently used entries until the store is no larger than "max_size".
+
+    :param max_size: maximal size of the store in bytes
+    :param directory: the directory of the store, default value "results.cache"
+
+    return: list of the keys of the removed entries
+    """
+
+    entries = list_entries(directory)
+    excess = entries["size"].sum() - max_size
+    removed = []
+    for key, size in zip(entries["key"], entries["size"]):
+        if (excess <= 0):
+            break
+        shutil.rmtree(os.path.join(directory, key), ignore_errors=True) # another process may be evicting the same entry
+        removed.append(key)
+        excess -= size
+
+    return removed
+
+
+def purge(keys=None, outdated=False, directory=DIRECTORY):
+    """
+    Removes entries from the store.
+
+    :param keys: list of keys of the entries to remove, default value None removes all entries (unless "outdated" is set)
+    :param outdated: a boolean indicating whether to only remove the entries of older versions of the code, default value False
+    :param directory: the directory of the store, default value "results.cache"
+
+    return: list of the keys of the removed entries
+    """
+
+    entries = list_entries(directory)
+    if (keys is not None):
+        entries = entries[entries["key"].isin(keys)]
+    if (outdated):
+        entries = entries[entries["code_version"] != code_version()]
+
+    for key in entries["key"]:
+        shutil.rmtree(os.path.join(directory, key))
+
+    return list(entries["key"])
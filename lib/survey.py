@@ -0,0 +1,244 @@
+import os
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from lib import complexity
+from lib import helpers
+from lib import windowing
+from lib import window_stats
+
+# the three day segments of the surveys (see "data/survey/features.md"), as the hours at which they start and end
+SEGMENTS = [("morning", 8, 12), ("afternoon", 12, 18), ("evening", 18, 23)]
+FEATURES = ["sleep_quality", "relaxation", "phy_intense", "fatigue", "pain", "ment_intense", "satisfaction", "mood", "stress"]
+
+
+def read_survey(patient_id, start=None):
+    """
+    Reads in the CSV file containing the daily survey features of a patient, and attaches a timestamp to every entry. The survey contains three
+    entries per day (one per day segment, see "SEGMENTS"), starting on the first full day of the recording. The timestamp of an entry is the
+    end of its day segment. Features which are not numeric (e.g. lists of types) are converted to nan.
+
+    :param patient_id: which patient's survey is read from memory
+    :param start: the first timestamp of the patient's recording, default value None takes it from the activity counts (see "helpers.read_counts")
+
+    return: dataframe containing the survey features, with the extra columns "day" and "segment", indexed by the timestamps "time"
+    """
+
+    survey = pd.read_csv("data/survey/survey"+str(patient_id)+".csv")
+    survey = survey.apply(lambda col: pd.to_numeric(col, errors="coerce") if col.dtype == object else col.astype(float))
+
+    start = pd.Timestamp(start) if start is not None else helpers.read_counts(patient_id).index[0]
+    first_day = start.normalize() + (pd.Timedelta("1 day") if start != start.normalize() else pd.Timedelta(0))
+    survey["day"] = first_day + pd.to_timedelta(np.arange(len(survey)) // len(SEGMENTS), unit="D")
+    survey["segment"] = [SEGMENTS[i % len(SEGMENTS)][0] for i in range(len(survey))]
+    ends = np.array([end for _, _, end in SEGMENTS])[np.arange(len(survey)) % len(SEGMENTS)]
+    survey.index = pd.DatetimeIndex(survey["day"] + pd.to_timedelta(ends, unit="h"), name="time")
+
+    return survey
+
+
+def align(dimensions, timestamps, activity, survey, features=FEATURES, lag="0 min"):
+    """
+    Aligns the evolution of the fractal dimension (at all scales) and the evolution of the summed activity counts with the survey entries.
+    Every survey entry is matched with the last window that ends at or before the end of its day segment (shifted by "lag"), so the window
+    covers the period leading up to the answers. Entries before the first or after the last window are matched with nan.
+
+    :param dimensions: 2D-array of fractal dimensions (one row per timestamp, one column per scale), as returned by "complexity_evolution"
+    :param timestamps: timestamps indicating the end of every window, as returned by "complexity_evolution"
+    :param activity: 1D-array of summed activity counts within the same windows, as returned by "helpers.sliding_window_activity"
+    :param survey: dataframe containing the survey features, indexed by the timestamps, as returned by "read_survey"
+    :param features: list of the survey features to align, default value "FEATURES"
+    :param lag: how long after the end of the window the day segment ends, described as a string from which a Timedelta can be extracted,
+                default value "0 min" matches the window ending with the day segment
+
+    return: three numpy arrays with one row per survey entry: the fractal dimensions (one column per scale), the summed activity counts,
+            and the survey features (one column per feature)
+    """
+
+    ends = pd.DatetimeIndex(pd.to_datetime(timestamps)).asi8
+    times = (survey.index - pd.Timedelta(lag)).asi8
+    idx = np.searchsorted(ends, times, side="right") - 1
+    step = ends[1] - ends[0] if len(ends) > 1 else 0
+    matched = (idx >= 0) & (times - ends[np.maximum(idx, 0)] <= step) # entries after the last window are not matched
+
+    x = np.where(matched[:, None], np.asarray(dimensions, dtype=float)[np.maximum(idx, 0)], np.nan)
+    a = np.where(matched, np.asarray(activity, dtype=float)[np.maximum(idx, 0)], np.nan)
+    y = survey[features].to_numpy(dtype=float)
+
+    return x, a, y
+
+
+def _pearson(x, y):
+    """
+    Pearson correlation of every column of x with every column of y, for every patient (and every resample) at once, using only the rows
+    in which both values are present.
+
+    :param x: array of shape (..., patients, rows, variables), nan for missing values
+    :param y: array of shape (..., patients, rows, features), nan for missing values
+
+    return: the correlations and the number of rows used, both of shape (..., patients, variables, features)
+    """
+
+    vx = ~np.isnan(x)
+    vy = ~np.isnan(y)
+    xm = np.where(vx, x, 0.0)
+    ym = np.where(vy, y, 0.0)
+    vx = vx.astype(float)
+    vy = vy.astype(float)
+
+    def pairwise(a, b):
+        return np.einsum("...nv,...nf->...vf", a, b)
+
+    n = pairwise(vx, vy)
+    sx = pairwise(xm, vy)
+    sy = pairwise(vx, ym)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = pairwise(xm, ym) - sx * sy / n
+        var_x = pairwise(xm ** 2, vy) - sx ** 2 / n
+        var_y = pairwise(vx, ym ** 2) - sy ** 2 / n
+        r = cov / np.sqrt(var_x * var_y)
+
+    return np.clip(r, -1, 1), n
+
+
+def _resampled_pearson(x, y, method, n_resamples, seed):
+    """
+    Correlations of a number of permuted (rows of y shuffled) or bootstrapped (rows resampled with replacement) versions of the data,
+    for every patient at once. Only the rows in which x is present (a survey entry matched with a window) are permuted or resampled, 
+    the padding rows and the unmatched entries stay in place, so every resample has as many complete rows as the observed data. 
+    Used by the workers of "correlations".
+
+    return: array of shape (n_resamples, patients, variables, features)
+    """
+
+    rng = np.random.default_rng(seed)
+    n_patients, n_rows = y.shape[:2]
+    valid = ~np.all(np.isnan(x), axis=-1) # (patients, rows)
+    n_valid = np.sum(valid, axis=-1)
+    targets = np.argsort(~valid, axis=-1, kind="stable") # the valid rows of every patient first, then the others, both in order
+    batch = max(1, 2**22 // max(1, x[0].size + y[0].size)) # number of resamples processed at once, to bound the memory
+    results = []
+    for done in range(0, n_resamples, batch):
+        size = min(batch, n_resamples - done)
+        if (method == "permutation"):
+            # the valid rows are sorted by a random key, the others keep their order after them, which gives a random permutation
+            # of the valid rows that is put back at the valid positions
+            order = np.argsort(np.where(valid, rng.random((size, n_patients, n_rows)), np.inf), axis=-1, kind="stable")
+        elif (method == "bootstrap"):
+            # the valid rows are drawn with replacement from the valid rows, the others keep their position
+            picks = (rng.random((size, n_patients, n_rows)) * n_valid[:, None]).astype(int)
+            order = np.where(np.arange(n_rows) < n_valid[:, None], np.take_along_axis(np.broadcast_to(targets, picks.shape), picks, axis=-1), targets)
+        else:
+            raise Exception("Unknown type of significance")
+        rows = np.empty_like(order)
+        np.put_along_axis(rows, np.broadcast_to(targets, order.shape), order, axis=-1)
+        if (method == "permutation"):
+            r, _ = _pearson(x[None], np.take_along_axis(y[None], rows[..., None], axis=2))
+        else:
+            r, _ = _pearson(np.take_along_axis(x[None], rows[..., None], axis=2), np.take_along_axis(y[None], rows[..., None], axis=2))
+        results.append(r)
+
+    return np.concatenate(results)
+
+
+def correlations(x, y, significance=None, n_resamples=1000, n_jobs=1, seed=None, confidence=0.95):
+    """
+    Computes the Pearson correlation of every variable in x with every feature in y, for every patient, in one vectorized pass. Optionally,
+    the significance is estimated by resampling, with the resamples divided among a process pool.
+
+    :param x: array of shape (patients, rows, variables), e.g. the aligned fractal dimensions of all patients, padded with nan to the same
+              number of rows
+    :param y: array of shape (patients, rows, features), e.g. the aligned survey features
+    :param significance: how to estimate the significance of the correlations. options:
+        - None: no significance is estimated
+        - permutation: the two-sided p-value of a permutation test, shuffling the rows of y within every patient
+        - bootstrap: a confidence interval of the correlation, resampling the rows within every patient with replacement
+    :param n_resamples: number of permutations or bootstrap resamples, default value 1000
+    :param n_jobs: number of worker processes among which the resamples are divided, default value 1. None or -1 uses one worker per core
+    :param seed: seed of the random number generator, default value None
+    :param confidence: confidence level of the bootstrap confidence interval, default value 0.95
+
+    return: dictionary containing the arrays "r" (correlations) and "n" (number of rows used), and "p_value" (permutation) or "ci_low" and
+            "ci_high" (bootstrap), all of shape (patients, variables, features)
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    r, n = _pearson(x, y)
+    result = {"r": r, "n": n}
+    if (significance is None):
+        return result
+
+    if (n_jobs is None or n_jobs < 1):
+        n_jobs = os.cpu_count()
+    seeds = np.random.SeedSequence(seed).spawn(n_jobs)
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(n_resamples), n_jobs)]
+    tasks = [(x, y, significance, size, s) for size, s in zip(sizes, seeds) if size > 0]
+    if (len(tasks) == 1):
+        resampled = _resampled_pearson(*tasks[0])
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            futures = [pool.submit(_resampled_pearson, *task) for task in tasks]
+            resampled = np.concatenate([future.result() for future in futures])
+
+    if (significance == "permutation"):
+        exceed = np.sum(np.abs(resampled) >= np.abs(r) - 1e-12, axis=0)
+        result["p_value"] = np.where(np.isnan(r), np.nan, (1 + exceed) / (1 + len(resampled)))
+    else:
+        alpha = (1 - confidence) / 2
+        result["ci_low"], result["ci_high"] = np.nanquantile(resampled, [alpha, 1 - alpha], axis=0)
+
+    return result
+
+
+def survey_correlations(patient_ids, width="3 days", step="5 min", n_min=1, n_max=9*60, s=1.1, features=FEATURES, lag="0 min",
+                        significance=None, n_resamples=1000, n_jobs=1, seed=None, store=False):
+    """
+    Correlates the evolution of the fractal dimension at every scale, and the evolution of the summed activity counts, with the daily survey
+    features of every patient. The evolutions are aligned with the survey entries as in "align", after which the correlations for all scales,
+    features and patients are computed at once (see "correlations"). The summed activity counts are treated as an extra variable next to the
+    scales, and as an extra feature next to the survey features, so the correlation between complexity and activity is included as well.
+
+    :param patient_ids: list of patient identifiers, whose activity counts and surveys are read from memory
+    :param width, step, n_min, n_max, s: the parameters of "complexity_evolution" (and of "helpers.sliding_window_activity")
+    :param features: list of the survey features to correlate, default value "FEATURES"
+    :param lag: how long after the end of the window the day segment ends, default value "0 min"
+    :param significance: None, "permutation" or "bootstrap" (see "correlations"), default value None
+    :param n_resamples: number of permutations or bootstrap resamples, default value 1000
+    :param n_jobs: number of worker processes for the resampling, default value 1
+    :param seed: seed of the random number generator, default value None
+    :param store: a boolean indicating whether to use the on-disk result store for the evolutions (see "result_store"), default value False
+
+    return: tidy dataframe with the columns "patient", "variable" (the scale, or "activity"), "feature", "r" and "n", and "p_value" or
+            "ci_low" and "ci_high" when the significance is estimated
+    """
+
+    xs = []
+    ys = []
+    for patient_id in patient_ids:
+        df = helpers.read_counts(patient_id)
+        if (store):
+            from lib import result_store
+            dimensions, timestamps, scales = result_store.cached_complexity_evolution(df, width, step, n_min, n_max, s)
+        else:
+            dimensions, timestamps, scales = complexity.complexity_evolution(df, width, step, n_min, n_max, s, incremental=True, batched_fit=True)
+        starts, stops, _ = windowing.window_bounds(df.index, width, step)
+        activity = window_stats.window_sums(df["counts"].to_numpy(dtype=float), starts, stops)
+
+        x, a, y = align(dimensions, timestamps, activity, read_survey(patient_id, df.index[0]), features, lag)
+        xs.append(np.column_stack((x, a)))
+        ys.append(np.column_stack((y, a)))
+
+    # pad all patients with nan to the same number of survey entries
+    rows = max(len(x) for x in xs)
+    x = np.stack([np.pad(x, ((0, rows - len(x)), (0, 0)), constant_values=np.nan) for x in xs])
+    y = np.stack([np.pad(y, ((0, rows - len(y)), (0, 0)), constant_values=np.nan) for y in ys])
+
+    result = correlations(x, y, significance, n_resamples, n_jobs, seed)
+
+    variables = list(scales) + ["activity"]
+    index = pd.MultiIndex.from_product([patient_ids, variables, list(features) + ["activity"]], names=["patient", "variable", "feature"])
+    table = pd.DataFrame({key: value.ravel() for key, value in result.items()}, index=index).reset_index()
+    table["n"] = table["n"].astype(int)
+
+    return table
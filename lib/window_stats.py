@@ -0,0 +1,124 @@
+import pandas as pd
+import numpy as np
+from lib import windowing
+
+def daily_totals(counts, day=24*60):
+    """
+    Calculates the total sum of the counts within every consecutive day, defined as a fixed amount of samples. The last day is not
+    counted if it is not full. Missing values (nan) are skipped.
+
+    :param counts: numpy array (or pandas Series) of equidistant activity counts
+    :param day: number of samples in a day, default value 24*60 for 1-minute counts
+
+    return: numpy array containing the sum of the counts of every full day
+    """
+
+    counts = np.asarray(counts, dtype=float)
+    n_days = len(counts) // day
+
+    return np.nansum(counts[:n_days*day].reshape(n_days, day), axis=1)
+
+
+def _cumulative(values, power=1, shift=0.0):
+    """
+    Cumulative sum of (values - shift)**power, preceded by a zero, in which missing values (nan) count as zero.
+    """
+    terms = np.where(np.isnan(values), 0.0, (values - shift) ** power)
+    return np.concatenate(([0.0], np.cumsum(terms)))
+
+
+def window_sums(values, starts, stops):
+    """
+    Calculates the sum of every window values[start:stop] as the difference of two cumulative sums, skipping missing values (nan).
+
+    :param values: 1D numpy array containing the signal values, e.g. the 1-minute activity counts
+    :param starts: numpy array containing the first position of every window in "values"
+    :param stops: numpy array containing the last+1 position of every window in "values"
+
+    return: numpy array containing the sum of every window
+    """
+
+    cs = _cumulative(np.asarray(values, dtype=float))
+    return cs[stops] - cs[starts]
+
+
+def window_means(values, starts, stops):
+    """
+    Calculates the mean of every window values[start:stop] from cumulative sums, skipping missing values (nan).
+
+    return: numpy array containing the mean of every window (nan for windows without any values)
+    """
+
+    values = np.asarray(values, dtype=float)
+    valid = np.concatenate(([0], np.cumsum(~np.isnan(values))))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return window_sums(values, starts, stops) / (valid[stops] - valid[starts])
+
+
+def window_variances(values, starts, stops):
+    """
+    Calculates the (population) variance of every window values[start:stop] from cumulative sums and sums of squares, skipping missing
+    values (nan). The values are centered around their global mean first, to keep the difference of the sums of squares numerically stable.
+
+    return: numpy array containing the variance of every window (nan for windows without any values)
+    """
+
+    values = np.asarray(values, dtype=float)
+    shift = np.nanmean(values) if np.any(~np.isnan(values)) else 0.0
+    valid = np.concatenate(([0], np.cumsum(~np.isnan(values))))
+    cs = _cumulative(values, 1, shift)
+    cs_sq = _cumulative(values, 2, shift)
+    n = valid[stops] - valid[starts]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (cs[stops] - cs[starts]) / n
+        return np.maximum(0.0, (cs_sq[stops] - cs_sq[starts]) / n - mean ** 2)
+
+
+def window_quantiles(values, starts, stops, q):
+    """
+    Calculates the q-th quantile of every window values[start:stop] (with linear interpolation, as numpy.quantile), skipping missing values (nan).
+    When all windows have the same length and stride, a rolling quantile is evaluated over the whole sequence in one pass, which is then
+    sampled at the end of every window. Otherwise, the quantile of every window is calculated separately.
+
+    :param q: the quantile to calculate, between 0 and 1
+
+    return: numpy array containing the q-th quantile of every window
+    """
+
+    values = np.asarray(values, dtype=float)
+    windows = windowing.window_views(values, starts, stops)
+
+    if (isinstance(windows, np.ndarray)):
+        rolling = pd.Series(values).rolling(windows.shape[1], min_periods=1).quantile(q)
+        return rolling.to_numpy()[stops - 1]
+
+    return np.array([np.nanquantile(window, q) if len(window) > 0 else np.nan for window in windows])
+
+
+def sliding_window_statistics(sig, width, step, quantiles=(), col="counts"):
+    """
+    Calculates statistics of the activity counts within the same sliding windows as "complexity_evolution", in vectorized passes over
+    the whole sequence instead of one window at a time.
+
+    :param sig: dataframe containing the activity counts and the timestamps these correspond to (the start of the 1-minute interval
+                for which these were obtained)
+    :param width: width of the window, described as a string from which a Timedelta can be extracted (e.g. "3 days")
+    :param step: the step size with which to advance the window, described as a string from which a Timedelta can be extracted (e.g. "5 min")
+    :param quantiles: list of quantiles (between 0 and 1) to calculate for every window, default none
+    :param col: the column of the dataframe over which to slide the window, default value "counts"
+
+    return: dataframe with the columns "sum", "mean", "var" and one column "q<quantile>" per quantile, indexed by the timestamps indicating
+            the end of every window (the same timestamps as returned by "complexity_evolution")
+    """
+
+    starts, stops, window_ends = windowing.window_bounds(sig.index, width, step)
+    values = sig[col].to_numpy(dtype=float)
+
+    stats = pd.DataFrame({"sum": window_sums(values, starts, stops),
+                          "mean": window_means(values, starts, stops),
+                          "var": window_variances(values, starts, stops)}, index=window_ends)
+    for q in quantiles:
+        stats["q" + str(q)] = window_quantiles(values, starts, stops, q)
+
+    return stats
@@ -0,0 +1,122 @@
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from lib import instrumentation
+
+@instrumentation.instrumented()
+def window_bounds(index, width, step):
+    """
+    Determines the windows of length width which slide over a sequence of timestamps with the given step size, until the end of the
+    window reaches the last timestamp (partially filled windows are not allowed). Every window contains the timestamps within
+    [start, start + width], boundaries included, which corresponds to label slicing sig[start:end] of a dataframe indexed by the timestamps.
+    The timestamps are converted to integer positions once, so the windows can be taken from the underlying array without any further
+    timestamp lookups.
+
+    :param index: sorted DatetimeIndex of the sequence
+    :param width: width of the window, described as a string from which a Timedelta can be extracted (e.g. "3 days")
+    :param step: the step size with which to advance the window, described as a string from which a Timedelta can be extracted (e.g. "5 min")
+
+    return: numpy arrays "starts" and "stops" containing the first and last+1 position of every window in "index", and a DatetimeIndex
+            containing the timestamp at the end of every window
+    """
+
+    window = pd.Timedelta(width)
+    step = pd.Timedelta(step)
+    n_windows = max(0, (index[-1] - index[0] - window) // step + 1)
+    window_starts = pd.date_range(index[0], periods=n_windows, freq=step)
+    window_ends = window_starts + window
+
+    starts = index.searchsorted(window_starts, side="left")
+    stops = index.searchsorted(window_ends, side="right")
+
+    return starts, stops, window_ends
+
+
+@instrumentation.instrumented()
+def regularize(index, values, sampling=None):
+    """
+    Detects the missing samples of a sequence (gaps due to non-wear, device swaps, ...) in one pass, by placing every sample on the regular
+    grid of timestamps from the first to the last timestamp. Samples which do not fall exactly on the grid are assigned to the nearest
+    grid point, when multiple samples fall on the same grid point the last one is kept. Missing values (nan) count as missing samples.
+
+    :param index: sorted DatetimeIndex of the sequence
+    :param values: 1D numpy array containing the signal values, e.g. the 1-minute activity counts
+    :param sampling: the time between two consecutive samples, described as a string from which a Timedelta can be extracted, default value
+                     None uses the median time between two consecutive timestamps
+
+    return: numpy array containing the values on the regular grid (zero for missing samples), boolean numpy array indicating which samples
+            are present, and the DatetimeIndex of the regular grid
+    """
+
+    times = index.asi8
+    if (len(times) == 0):
+        return np.zeros(0), np.zeros(0, dtype=bool), index
+    period = pd.Timedelta(sampling).value if sampling is not None else int(np.median(np.diff(times))) if len(times) > 1 else 1
+
+    positions = np.rint((times - times[0]) / period).astype(np.int64)
+    length = positions[-1] + 1
+    regular = np.zeros(length)
+    valid = np.zeros(length, dtype=bool)
+    present = ~np.isnan(values)
+    regular[positions[present]] = values[present]
+    valid[positions[present]] = True
+
+    return regular, valid, pd.date_range(index[0], periods=length, freq=pd.Timedelta(period), name=index.name)
+
+
+def window_coverage(valid, starts, stops):
+    """
+    Calculates the fraction of samples which are present within every window, as the difference of two cumulative counts of the present
+    samples, so the coverage of every window takes constant time.
+
+    :param valid: boolean numpy array indicating which samples are present (see "regularize")
+    :param starts: numpy array containing the first position of every window
+    :param stops: numpy array containing the last+1 position of every window
+
+    return: numpy array containing the coverage (between 0 and 1) of every window
+    """
+
+    cumulative = np.concatenate(([0], np.cumsum(valid)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (cumulative[stops] - cumulative[starts]) / (stops - starts)
+
+
+def window_views(values, starts, stops):
+    """
+    Returns the windows values[start:stop] as views on the array "values", without copying any data. When all windows have the same
+    length and advance with a constant stride (as is the case for an equidistant sequence without gaps), the windows are returned as the
+    rows of one 2D strided view. Otherwise, a list of 1D views (basic slices) is returned.
+
+    :param values: 1D numpy array containing the signal values, e.g. the 1-minute activity counts
+    :param starts: numpy array containing the first position of every window in "values"
+    :param stops: numpy array containing the last+1 position of every window in "values"
+
+    return: 2D numpy array (view) with one window per row, or list of 1D numpy arrays (views) with one entry per window
+    """
+
+    lengths = stops - starts
+    if (len(starts) > 0 and lengths[0] > 0 and np.all(lengths == lengths[0])):
+        stride = starts[1] - starts[0] if len(starts) > 1 else 1
+        if (stride > 0 and np.all(np.diff(starts) == stride)):
+            return sliding_window_view(values, lengths[0])[starts[0]::stride][:len(starts)]
+
+    return [values[start:stop] for start, stop in zip(starts, stops)]
+
+
+def sliding_windows(sig, width, step, col="counts"):
+    """
+    Slides a window of length width over the column "col" of a dataframe with the given step size.
+
+    :param sig: dataframe containing the activity counts and the timestamps these correspond to (the start of the 1-minute interval
+                for which these were obtained)
+    :param width: width of the window, described as a string from which a Timedelta can be extracted (e.g. "3 days")
+    :param step: the step size with which to advance the window, described as a string from which a Timedelta can be extracted (e.g. "5 min")
+    :param col: the column of the dataframe over which to slide the window, default value "counts"
+
+    return: the windows as returned by "window_views", and a DatetimeIndex containing the timestamp at the end of every window
+    """
+
+    starts, stops, window_ends = window_bounds(sig.index, width, step)
+    values = sig[col].to_numpy()
+
+    return window_views(values, starts, stops), window_ends